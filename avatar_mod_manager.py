@@ -11,37 +11,12 @@ import math
 import sys
 from datetime import datetime
 import multiprocessing
-from multiprocessing import Pool, cpu_count
+from collections import OrderedDict
 from PIL import Image, ImageTk
 
-from pak_tool import unpack_pak, pack_pak, load_dlls
+from pak_tool import load_dlls, list_pak, merge_paks, unpack_pak, CancelToken, PakReader
 
 
-def _collect_files_chunk(args):
-    """Helper function to collect files from a directory chunk (for multiprocessing)"""
-    root_dir, subdirs, viewing_dir = args
-    file_list = []
-    
-    for subdir in subdirs:
-        dir_path = os.path.join(root_dir, subdir) if subdir else root_dir
-        
-        try:
-            for root, dirs, files in os.walk(dir_path):
-                for file in files:
-                    if file.startswith('.'):
-                        continue
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, viewing_dir)
-                    try:
-                        size = os.path.getsize(full_path)
-                        file_list.append((rel_path, size))
-                    except:
-                        pass
-        except:
-            pass
-    
-    return file_list
-
 class RotatingLoadingIcon(tk.Canvas):
     """Custom rotating loading icon widget"""
     
@@ -120,6 +95,22 @@ class RotatingLoadingIcon(tk.Canvas):
             self.after_cancel(self.timer_id)
             self.timer_id = None
 
+# File tree preview: extensions always shown as text, the largest file that
+# is decoded just for the preview pane, how much of it is shown, and the
+# size of the cache of recently decoded entries
+PREVIEW_TEXT_EXTENSIONS = ('.xml', '.txt', '.ini', '.cfg', '.lua', '.json', '.csv', '.log', '.fx', '.hlsl')
+PREVIEW_MAX_DECODE = 8 * 1024 * 1024
+PREVIEW_MAX_CHARS = 256 * 1024
+PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def looks_like_text(path, data):
+    """Text files get the preview pane, anything else is opened with the OS"""
+    if path.lower().endswith(PREVIEW_TEXT_EXTENSIONS):
+        return True
+    return b'\0' not in data[:4096]
+
+
 class EnhancedProgressDialog(tk.Toplevel):
     """Enhanced progress dialog with file tracking and detailed log"""
     
@@ -134,6 +125,8 @@ class EnhancedProgressDialog(tk.Toplevel):
         
         self.was_cancelled = False
         self.is_complete = False
+        # Handed to pak_tool so cancelling stops the running merge itself
+        self.cancel_token = CancelToken()
         
         # Main frame
         main_frame = tk.Frame(self, bg="#1e1e1e")
@@ -226,6 +219,7 @@ class EnhancedProgressDialog(tk.Toplevel):
         """Handle cancel button"""
         if not self.was_cancelled and not self.is_complete:
             self.was_cancelled = True
+            self.cancel_token.cancel()
             self.cancel_button.config(state=tk.DISABLED, text="Cancelling...",
                                      bg="#555555")
             self.append_log("❌ Cancellation requested...")
@@ -502,7 +496,7 @@ class ModManager:
         # Load LZO DLLs for pak_tool
         if not load_dlls():
             ModernMessageBox(self.root, "DLL Error",
-                        "Failed to load LZO DLLs. Make sure minilzo DLL files are in the program folder.", "error")
+                        "Failed to load an LZO backend. Make sure minilzo DLL files are in the program folder, or install liblzo2 / python-lzo.", "error")
             self.root.destroy()
             return
         
@@ -520,11 +514,13 @@ class ModManager:
         self.backup_path = "patch.pak.backup"
         self.mods = []
         self.mod_enabled = {}
-        self.temp_dir = None
         self.pak_contents_cache = {}
-        
-        # Add pak_tool_path for compatibility
-        self.pak_tool_path = "pak_tool.py"  # Not actually used, but referenced in code
+        self.current_pak_path = None
+        self.file_tree_paths = {}
+        # (pak path, pak mtime, entry path) -> decoded bytes, least recently used first
+        self.preview_cache = OrderedDict()
+        self.preview_lock = threading.Lock()
+        self.preview_request = 0
         
         self.load_config()
         self.setup_styles()
@@ -761,12 +757,39 @@ class ModManager:
                                     cursor="hand2", activebackground=self.bg_medium)
         collapse_all_btn.pack(side=tk.LEFT)
 
+        extract_btn = tk.Button(expand_frame, text="📤 Extract Selected", 
+                                command=self.extract_selected_files,
+                                bg=self.bg_light, fg=self.text_color,
+                                font=("Segoe UI", 8), relief=tk.FLAT, padx=10, pady=4,
+                                cursor="hand2", activebackground=self.bg_medium)
+        extract_btn.pack(side=tk.RIGHT)
+
         # File count label
         self.file_count_label = tk.Label(tree_tab, text="", bg=self.bg_medium,
                                         fg=self.text_secondary, font=("Segoe UI", 8),
                                         anchor=tk.W)
         self.file_count_label.pack(fill=tk.X, padx=10, pady=(5, 5))
 
+        # Preview pane for text files, below the tree
+        preview_frame = tk.Frame(tree_tab, bg=self.bg_medium)
+        preview_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 10))
+
+        self.preview_label = tk.Label(preview_frame, text="Preview: select a file",
+                                    bg=self.bg_medium, fg=self.text_secondary,
+                                    font=("Segoe UI", 8), anchor=tk.W)
+        self.preview_label.pack(fill=tk.X, pady=(0, 3))
+
+        preview_scroll = tk.Scrollbar(preview_frame, bg=self.bg_medium)
+        preview_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.preview_text = tk.Text(preview_frame, bg=self.bg_light, fg=self.text_color,
+                                font=("Consolas", 9), wrap=tk.NONE, height=12,
+                                yscrollcommand=preview_scroll.set, relief=tk.FLAT,
+                                highlightthickness=0, padx=8, pady=6,
+                                state=tk.DISABLED)
+        self.preview_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        preview_scroll.config(command=self.preview_text.yview)
+
         # File tree with scrollbars
         tree_container = tk.Frame(tree_tab, bg=self.bg_medium)
         tree_container.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
@@ -794,6 +817,10 @@ class ModManager:
         self.file_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         tree_vsb.config(command=self.file_tree.yview)
         tree_hsb.config(command=self.file_tree.xview)
+        
+        # Selecting a file previews it, double-click opens it
+        self.file_tree.bind('<<TreeviewSelect>>', self.preview_tree_file)
+        self.file_tree.bind('<Double-1>', self.open_tree_file)
 
         # Action Buttons
         action_frame = tk.Frame(main_container, bg=self.bg_dark)
@@ -921,7 +948,7 @@ class ModManager:
             message += "• Merge temporary files\n"
         if has_viewing:
             message += "• Extracted mod viewing files\n"
-        message += "\nYou'll need to add mods again or run 'Merge Mods' to re-extract.\n\nContinue?"
+        message += "\nMods are merged straight from their PAK files, so these are no longer needed.\n\nContinue?"
         
         confirm = ModernConfirmBox(self.root, "Clean Temp Files", message)
         confirm.wait_window()
@@ -1005,256 +1032,6 @@ class ModManager:
         """Handle mod selection - update details panel"""
         self.update_details_panel()
 
-    def get_viewing_dir_for_mod(self, mod_path):
-        """Get the extraction directory for viewing a specific mod"""
-        # Handle both frozen (exe) and unfrozen (script) execution
-        if getattr(sys, 'frozen', False):
-            # Running as compiled executable
-            script_dir = os.path.dirname(sys.executable)
-        else:
-            # Running as script
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        viewing_dir = os.path.join(script_dir, "mod_viewing")
-        
-        # Find the index of this mod in the list
-        try:
-            mod_idx = self.mods.index(mod_path)
-            folder_name = f"mod{mod_idx + 1}"
-        except ValueError:
-            # If mod not in list anymore, return None
-            return None
-        
-        return os.path.join(viewing_dir, folder_name)
-
-    def unpack_mod_for_viewing(self, mod_path):
-        """Unpack a mod for viewing in the file tree (in background thread)"""
-        if not os.path.exists(mod_path):
-            return
-        
-        if not os.path.exists(self.pak_tool_path):
-            return
-        
-        viewing_dir = self.get_viewing_dir_for_mod(mod_path)
-        
-        # If already extracted, skip
-        if os.path.exists(viewing_dir):
-            return
-        
-        # Show status
-        self.status_var.set(f"Extracting {os.path.basename(mod_path)} for viewing...")
-        
-        # Run extraction in thread
-        thread = threading.Thread(target=self._unpack_for_viewing_worker,
-                                args=(mod_path, viewing_dir), daemon=True)
-        thread.start()
-
-    def _unpack_for_viewing_worker(self, mod_path, viewing_dir):
-        """Worker thread to unpack mod for viewing using pak_tool"""
-        import time
-        
-        try:
-            # Create viewing directory
-            os.makedirs(viewing_dir, exist_ok=True)
-            
-            # Create marker file to track which mod this folder belongs to
-            marker_file = os.path.join(viewing_dir, ".mod_source")
-            with open(marker_file, 'w') as f:
-                f.write(mod_path)
-            
-            mod_name = os.path.basename(mod_path)
-            
-            # Use pak_tool directly - it handles its own progress
-            self.root.after(0, lambda mn=mod_name: 
-                        self.status_var.set(f"Extracting {mn}..."))
-            
-            # Call unpack_pak directly
-            success = unpack_pak(mod_path, viewing_dir, use_parallel=True)
-            
-            if success:
-                # Final count
-                file_count = sum(1 for _, _, files in os.walk(viewing_dir) 
-                            for _ in files if not _.startswith('.'))
-                
-                self.root.after(0, lambda fc=file_count, mn=mod_name: 
-                            self.status_var.set(f"✓ Extracted {mn} ({fc} files)"))
-                
-                # Clear cache
-                if mod_path in self.pak_contents_cache:
-                    del self.pak_contents_cache[mod_path]
-                
-                # Final refresh
-                selection = self.mod_listbox.selection()
-                if selection:
-                    idx = int(selection[0])
-                    if idx < len(self.mods) and self.mods[idx] == mod_path:
-                        self.root.after(0, lambda mp=mod_path, vd=viewing_dir: 
-                                    self._update_file_tree_async(mp, vd))
-            else:
-                self.root.after(0, lambda mn=mod_name: 
-                            self.status_var.set(f"⚠️ Failed to extract {mn}"))
-        
-        except Exception as e:
-            error_msg = str(e)
-            self.root.after(0, lambda msg=error_msg: 
-                        self.status_var.set(f"⚠️ Extraction error: {msg}"))
-                
-    def _update_file_tree_async(self, mod_path, viewing_dir):
-        """Update file tree asynchronously without blocking UI"""
-        # Quick check if we should update
-        selection = self.mod_listbox.selection()
-        if not selection:
-            return
-        
-        idx = int(selection[0])
-        if idx >= len(self.mods) or self.mods[idx] != mod_path:
-            return
-        
-        # Run file collection in a separate thread
-        thread = threading.Thread(target=self._collect_and_update_files,
-                                args=(mod_path, viewing_dir), daemon=True)
-        thread.start()
-
-    def _collect_and_update_files(self, mod_path, viewing_dir):
-        """Collect files in background thread and update UI"""
-        try:
-            # Get top-level subdirectories
-            top_level_items = []
-            try:
-                items = os.listdir(viewing_dir)
-                for item in items:
-                    if item.startswith('.'):
-                        continue
-                    item_path = os.path.join(viewing_dir, item)
-                    if os.path.isdir(item_path):
-                        top_level_items.append(item)
-            except:
-                return
-            
-            # Check if there are files in root
-            root_files = []
-            try:
-                for item in os.listdir(viewing_dir):
-                    if item.startswith('.'):
-                        continue
-                    item_path = os.path.join(viewing_dir, item)
-                    if os.path.isfile(item_path):
-                        rel_path = os.path.relpath(item_path, viewing_dir)
-                        size = os.path.getsize(item_path)
-                        root_files.append((rel_path, size))
-            except:
-                pass
-            
-            # Use multiprocessing for large directories
-            num_workers = min(cpu_count(), max(1, len(top_level_items)), 4)
-            
-            if num_workers > 1 and len(top_level_items) > 1:
-                # Parallel processing
-                chunk_size = max(1, len(top_level_items) // num_workers)
-                chunks = []
-                
-                for i in range(0, len(top_level_items), chunk_size):
-                    chunk = top_level_items[i:i + chunk_size]
-                    chunks.append((viewing_dir, chunk, viewing_dir))
-                
-                with Pool(processes=num_workers) as pool:
-                    results = pool.map(_collect_files_chunk, chunks)
-                
-                file_list = root_files.copy()
-                for result in results:
-                    file_list.extend(result)
-            else:
-                # Single-threaded
-                file_list = []
-                for root, dirs, files in os.walk(viewing_dir):
-                    for file in files:
-                        if file.startswith('.'):
-                            continue
-                        full_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(full_path, viewing_dir)
-                        try:
-                            size = os.path.getsize(full_path)
-                            file_list.append((rel_path, size))
-                        except:
-                            pass
-            
-            if not file_list:
-                return
-            
-            # Update UI in main thread
-            self.root.after(0, lambda fl=file_list: self._apply_file_list_to_tree(fl))
-            
-        except Exception as e:
-            pass
-
-    def _apply_file_list_to_tree(self, file_list):
-        """Apply collected file list to tree (runs in main thread)"""
-        # Check if still showing the same mod
-        selection = self.mod_listbox.selection()
-        if not selection:
-            return
-        
-        self.populate_file_tree(file_list)
-        
-        # Update file count
-        total_size = sum(size for _, size in file_list)
-        size_mb = total_size / (1024 * 1024)
-        
-        # Check if extraction is complete
-        current_status = self.status_var.get()
-        if "Extracting" in current_status:
-            self.file_count_label.config(text=f"{len(file_list)} files ({size_mb:.2f} MB) - Extracting...")
-        else:
-            self.file_count_label.config(text=f"{len(file_list)} files ({size_mb:.2f} MB)")
-
-    def reorganize_viewing_folders(self):
-        """Reorganize mod_viewing folders to match current load order"""
-        # Handle both frozen (exe) and unfrozen (script) execution
-        if getattr(sys, 'frozen', False):
-            script_dir = os.path.dirname(sys.executable)
-        else:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        viewing_dir = os.path.join(script_dir, "mod_viewing")
-        
-        if not os.path.exists(viewing_dir):
-            return
-        
-        # Build a map of mod_path -> current folder location
-        folder_map = {}
-        for i in range(1, 1000):  # Check up to mod999
-            folder_path = os.path.join(viewing_dir, f"mod{i}")
-            marker_file = os.path.join(folder_path, ".mod_source")  # NO .txt extension
-            
-            if os.path.exists(marker_file):
-                try:
-                    with open(marker_file, 'r') as f:
-                        mod_path = f.read().strip()
-                        folder_map[mod_path] = folder_path
-                except:
-                    pass
-        
-        # Step 1: Rename all to temporary names
-        temp_map = {}
-        for mod_path, folder_path in folder_map.items():
-            temp_name = folder_path + "_temp"
-            try:
-                os.rename(folder_path, temp_name)
-                temp_map[mod_path] = temp_name
-            except Exception as e:
-                print(f"Error creating temp: {e}")
-        
-        # Step 2: Rename to correct positions based on current mod order
-        for new_idx, mod_path in enumerate(self.mods, 1):
-            if mod_path in temp_map:
-                temp_path = temp_map[mod_path]
-                final_path = os.path.join(viewing_dir, f"mod{new_idx}")
-                
-                try:
-                    os.rename(temp_path, final_path)
-                except Exception as e:
-                    print(f"Error renaming to final position: {e}")
-
     def update_details_panel(self):
         """Update the details panel with selected mod info"""
         self.details_text.config(state=tk.NORMAL)
@@ -1313,8 +1090,9 @@ class ModManager:
         self.load_pak_contents(mod_path)
 
     def load_pak_contents(self, pak_path):
-        """Load and display contents of a PAK file from extracted folders"""
+        """Load and display contents of a PAK file straight from its metadata"""
         self.clear_file_tree()
+        self.current_pak_path = pak_path
         
         if not os.path.exists(pak_path):
             self.file_count_label.config(text="File not found")
@@ -1326,45 +1104,15 @@ class ModManager:
             self.populate_file_tree(file_list)
             return
         
-        # Get the viewing directory for this mod
-        viewing_dir = self.get_viewing_dir_for_mod(pak_path)
-        
-        if viewing_dir is None:
-            self.file_count_label.config(text="Mod not in list")
-            return
-        
-        if not os.path.exists(viewing_dir):
-            # Try to unpack it now
-            self.file_count_label.config(text="Extracting PAK file... (check status bar)")
-            self.root.update_idletasks()
-            self.unpack_mod_for_viewing(pak_path)
-            return  # Let the worker thread handle the updates
-        
-        # Check if extraction is still in progress (check for .mod_source marker)
-        marker_file = os.path.join(viewing_dir, ".mod_source")
-        if not os.path.exists(marker_file):
-            self.file_count_label.config(text="Extraction in progress...")
+        # Read the file list from the PAK index, no extraction needed
+        try:
+            file_list = [(entry['path'], entry['file_size']) for entry in list_pak(pak_path)]
+        except Exception as e:
+            self.file_count_label.config(text=f"Failed to read PAK: {str(e)}")
             return
         
-        # Collect file list from extracted directory
-        self.file_count_label.config(text="Loading files...")
-        self.root.update_idletasks()
-        
-        file_list = []
-        for root, dirs, files in os.walk(viewing_dir):
-            for file in files:
-                if file.startswith('.'):  # Skip marker files
-                    continue
-                full_path = os.path.join(root, file)
-                rel_path = os.path.relpath(full_path, viewing_dir)
-                try:
-                    size = os.path.getsize(full_path)
-                    file_list.append((rel_path, size))
-                except:
-                    pass
-        
         if not file_list:
-            self.file_count_label.config(text="No files found or still extracting...")
+            self.file_count_label.config(text="No files found")
             return
         
         # Cache the results
@@ -1414,7 +1162,7 @@ class ModManager:
         # Store for filtering
         self.current_file_list = file_list
 
-    def _insert_tree_items(self, parent, tree_dict):
+    def _insert_tree_items(self, parent, tree_dict, prefix=""):
         """Recursively insert items into tree"""
         # Sort: directories first, then files
         items = sorted(tree_dict.items(), 
@@ -1425,8 +1173,9 @@ class ModManager:
                 # Insert directory
                 node = self.file_tree.insert(parent, tk.END, text=f"📁 {name}", 
                                             values=("",), open=False)
+                self.file_tree_paths[node] = ('dir', prefix + name, 0)
                 # Recursively insert children
-                self._insert_tree_items(node, data)
+                self._insert_tree_items(node, data, prefix + name + "\\")
             else:
                 # Insert file
                 size = data
@@ -1437,8 +1186,9 @@ class ModManager:
                 else:
                     size_str = f"{size / (1024 * 1024):.2f} MB"
                 
-                self.file_tree.insert(parent, tk.END, text=f"📄 {name}", 
-                                    values=(size_str,))
+                node = self.file_tree.insert(parent, tk.END, text=f"📄 {name}", 
+                                            values=(size_str,))
+                self.file_tree_paths[node] = ('file', prefix + name, size)
 
     def clear_file_tree(self):
         """Clear the file tree"""
@@ -1446,6 +1196,9 @@ class ModManager:
             self.file_tree.delete(item)
         self.file_count_label.config(text="")
         self.current_file_list = []
+        self.set_preview("Preview: select a file")
+        # Tree item -> ('file' or 'dir', path inside the PAK, size)
+        self.file_tree_paths = {}
 
     def filter_file_tree(self):
         """Filter file tree based on search"""
@@ -1478,13 +1231,174 @@ class ModManager:
             else:
                 size_str = f"{size / (1024 * 1024):.2f} MB"
             
-            self.file_tree.insert("", tk.END, text=f"📄 {file_path}", 
-                                values=(size_str,))
+            node = self.file_tree.insert("", tk.END, text=f"📄 {file_path}", 
+                                        values=(size_str,))
+            self.file_tree_paths[node] = ('file', file_path, size)
         
         total_size = sum(size for _, size in filtered)
         size_mb = total_size / (1024 * 1024)
         self.file_count_label.config(text=f"{len(filtered)} matching files ({size_mb:.2f} MB)")
 
+    def read_pak_entry(self, pak_path, pak_file_path):
+        """
+        Decode a single entry straight from the PAK into memory. Recently
+        decoded entries are kept in a small LRU cache, so flipping between
+        files does not decode them again.
+        """
+        key = (pak_path, os.stat(pak_path).st_mtime_ns, pak_file_path.lower())
+        with self.preview_lock:
+            data = self.preview_cache.get(key)
+            if data is not None:
+                self.preview_cache.move_to_end(key)
+                return data
+        
+        with PakReader(pak_path) as reader:
+            data = reader.read(pak_file_path)
+        
+        with self.preview_lock:
+            self.preview_cache[key] = data
+            cached_bytes = sum(len(value) for value in self.preview_cache.values())
+            while cached_bytes > PREVIEW_CACHE_BYTES and len(self.preview_cache) > 1:
+                _, evicted = self.preview_cache.popitem(last=False)
+                cached_bytes -= len(evicted)
+        return data
+
+    def _selected_tree_file(self):
+        """Path inside the PAK and size of the selected file node, or (None, 0)"""
+        selection = self.file_tree.selection()
+        if not selection or not self.current_pak_path:
+            return None, 0
+        kind, pak_file_path, size = self.file_tree_paths.get(selection[0], (None, None, 0))
+        return (pak_file_path, size) if kind == 'file' else (None, 0)
+
+    def set_preview(self, title, text=""):
+        # Anything shown in the pane outdates decodes still in flight
+        self.preview_request += 1
+        self.preview_label.config(text=title)
+        self.preview_text.config(state=tk.NORMAL)
+        self.preview_text.delete(1.0, tk.END)
+        self.preview_text.insert(tk.END, text)
+        self.preview_text.config(state=tk.DISABLED)
+
+    def preview_tree_file(self, event=None):
+        """Show the selected file in the preview pane, decoded in the background"""
+        pak_file_path, size = self._selected_tree_file()
+        if pak_file_path is None:
+            self.set_preview("Preview: select a file")
+            return
+        
+        if size > PREVIEW_MAX_DECODE:
+            self.set_preview(f"Preview: {pak_file_path}",
+                             f"File is too large to preview ({size / (1024 * 1024):.2f} MB) - double-click to open it.")
+            return
+        
+        # Results of slower earlier requests are dropped
+        self.set_preview(f"Preview: {pak_file_path} (decoding...)")
+        request = self.preview_request
+        pak_path = self.current_pak_path
+        
+        def show(text):
+            if request == self.preview_request:
+                self.set_preview(f"Preview: {pak_file_path}", text)
+        
+        def worker():
+            try:
+                data = self.read_pak_entry(pak_path, pak_file_path)
+            except Exception as e:
+                self.root.after(0, show, f"Could not read file: {str(e)}")
+                return
+            
+            if looks_like_text(pak_file_path, data):
+                text = data[:PREVIEW_MAX_CHARS].decode('utf-8', errors='replace')
+                if len(data) > PREVIEW_MAX_CHARS:
+                    text += f"\n\n... ({len(data) - PREVIEW_MAX_CHARS} more bytes - double-click to open the whole file)"
+            else:
+                text = "Binary file - double-click to open it with its default application."
+            self.root.after(0, show, text)
+        
+        threading.Thread(target=worker, daemon=True).start()
+
+    def open_tree_file(self, event):
+        """Double-click on a file in the tree - decode it and open it with the OS"""
+        item = self.file_tree.identify_row(event.y)
+        kind, pak_file_path, _ = self.file_tree_paths.get(item, (None, None, 0))
+        if kind != 'file' or not self.current_pak_path:
+            return
+        
+        self.status_var.set(f"Opening {pak_file_path}...")
+        
+        thread = threading.Thread(target=self._open_file_worker,
+                                args=(self.current_pak_path, pak_file_path), daemon=True)
+        thread.start()
+
+    def _open_file_worker(self, pak_path, pak_file_path):
+        """Worker thread - write the decoded entry to a temp file and hand it to the OS"""
+        try:
+            data = self.read_pak_entry(pak_path, pak_file_path)
+            # A fresh folder per open: most mods are named patch.pak, and a copy
+            # still open in another program must not be overwritten
+            viewing_root = os.path.join(self.script_dir, "mod_viewing")
+            os.makedirs(viewing_root, exist_ok=True)
+            viewing_dir = tempfile.mkdtemp(dir=viewing_root)
+            output_path = os.path.join(viewing_dir, os.path.basename(pak_file_path.replace('\\', os.sep)))
+            with open(output_path, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            self.root.after(0, lambda msg=str(e): self.status_var.set(f"❌ Could not open {pak_file_path}: {msg}"))
+            return
+        
+        self.root.after(0, lambda: self.status_var.set(f"✓ Opened {pak_file_path}"))
+        self.open_with_os(output_path)
+
+    def open_with_os(self, path):
+        """Open a file or folder with its default application"""
+        try:
+            if sys.platform == 'win32':
+                os.startfile(path)
+            elif sys.platform == 'darwin':  # macOS
+                subprocess.Popen(['open', path])
+            else:  # linux
+                subprocess.Popen(['xdg-open', path])
+        except Exception as e:
+            print(f"Failed to open {path}: {e}")
+
+    def extract_selected_files(self):
+        """Extract the selected file or folder of the file tree to a chosen folder"""
+        selection = self.file_tree.selection()
+        kind, pak_file_path, _ = self.file_tree_paths.get(selection[0], (None, None, 0)) if selection else (None, None, 0)
+        
+        if kind is None or not self.current_pak_path:
+            ModernMessageBox(self.root, "Nothing Selected",
+                        "Select a file or folder in the Files tab to extract.", "warning")
+            return
+        
+        output_dir = filedialog.askdirectory(title="Extract To")
+        if not output_dir:
+            return
+        
+        # Only the selected entries are read from the PAK
+        if kind == 'dir':
+            filters = {'include': [pak_file_path]}
+        else:
+            filters = {'paths': [pak_file_path]}
+        
+        pak_path = self.current_pak_path
+        self.status_var.set(f"Extracting {pak_file_path}...")
+        
+        def worker():
+            try:
+                stats = unpack_pak(pak_path, output_dir, **filters)
+            except Exception as e:
+                self.root.after(0, lambda msg=str(e): self.status_var.set(f"❌ Extraction failed: {msg}"))
+                return
+            if stats:
+                self.root.after(0, lambda: self.status_var.set(
+                    f"✓ Extracted {stats.files_done} files from {pak_file_path} to {output_dir}"))
+            else:
+                self.root.after(0, lambda: self.status_var.set(f"❌ Could not extract {pak_file_path}"))
+        
+        threading.Thread(target=worker, daemon=True).start()
+
     def backup_original(self):
         """Backup the selected mod's PAK file to pak_backups/timestamp folder"""
         selection = self.mod_listbox.selection()
@@ -1607,9 +1521,6 @@ class ModManager:
                 self.mod_enabled[filename] = True
                 self.refresh_listbox()
                 self.status_var.set(f"Added: {os.path.basename(filename)}")
-                
-                # Auto-unpack the mod for viewing
-                self.unpack_mod_for_viewing(filename)
             else:
                 ModernMessageBox(self.root, "Duplicate Mod",
                             "This mod is already in the list!", "warning")
@@ -1622,21 +1533,10 @@ class ModManager:
             if removed in self.mod_enabled:
                 del self.mod_enabled[removed]
             
-            # Remove the extracted folder
-            viewing_dir = self.get_viewing_dir_for_mod(removed)
-            if viewing_dir and os.path.exists(viewing_dir):
-                try:
-                    shutil.rmtree(viewing_dir)
-                except:
-                    pass
-            
             self.refresh_listbox()
             self.update_details_panel()
             self.status_var.set(f"Removed: {os.path.basename(removed)}")
             
-            # Reorganize remaining folders
-            self.reorganize_viewing_folders()
-            
     def move_up(self):
         selection = self.mod_listbox.selection()
         if selection:
@@ -1646,7 +1546,6 @@ class ModManager:
                 self.refresh_listbox()
                 self.mod_listbox.selection_set(str(idx-1))
                 self.mod_listbox.see(str(idx-1))
-                self.reorganize_viewing_folders()
 
     def move_down(self):
         selection = self.mod_listbox.selection()
@@ -1657,7 +1556,6 @@ class ModManager:
                 self.refresh_listbox()
                 self.mod_listbox.selection_set(str(idx+1))
                 self.mod_listbox.see(str(idx+1))
-                self.reorganize_viewing_folders()
 
     def refresh_listbox(self):
         # Clear existing items
@@ -1708,96 +1606,88 @@ class ModManager:
         thread.start()
 
     def _merge_worker(self, progress_dialog, enabled_mods):
-        """Worker thread for merging mods - now uses pak_tool directly"""
+        """Worker thread for merging mods - merges the PAK files directly"""
         try:
             progress_dialog.append_log("🚀 Starting merge process, please wait.")
             progress_dialog.set_status("Preparing, please wait.")
             progress_dialog.set_progress(0)
             
-            # Create temporary directory in the program's root directory
-            if getattr(sys, 'frozen', False):
-                script_dir = os.path.dirname(sys.executable)
-            else:
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-            
-            self.temp_dir = os.path.join(script_dir, "temp_merge")
-            viewing_dir = os.path.join(script_dir, "mod_viewing")
-            
-            # Remove old temp directory if it exists
-            if os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-            
-            os.makedirs(self.temp_dir, exist_ok=True)
-            merge_dir = os.path.join(self.temp_dir, "merge")
-            os.makedirs(merge_dir, exist_ok=True)
-            
-            progress_dialog.append_log(f"📁 Created temporary directory: {self.temp_dir}")
             progress_dialog.append_log(f"ℹ️  Merging {len(enabled_mods)} enabled mods (skipping {len(self.mods) - len(enabled_mods)} disabled)")
             
             total_mods = len(enabled_mods)
-            files_copied = 0
             total_files = 0
+            mods_to_merge = []
             
-            # Copy from mod_viewing folders (reverse order, so lowest priority first)
-            for i, mod_path in enumerate(reversed(enabled_mods), 1):
+            # Read every mod's index, in load order (highest priority first)
+            for i, mod_path in enumerate(enabled_mods, 1):
                 if progress_dialog.was_cancelled:
                     progress_dialog.append_log("⚠️ Merge cancelled by user")
                     self.root.after(0, lambda: self._cleanup_and_close(progress_dialog, cancelled=True))
                     return
                 
                 mod_name = os.path.basename(mod_path)
-                progress = (i - 1) / (total_mods + 1) * 100
-                
-                # Find the mod's index in the full mod list to get correct folder name
-                try:
-                    mod_idx = self.mods.index(mod_path)
-                    source_folder = os.path.join(viewing_dir, f"mod{mod_idx + 1}")
-                except ValueError:
-                    progress_dialog.append_log(f"⚠️ Skipping {mod_name} - not found in mod list")
-                    continue
+                # Reading the indexes is quick, the merge itself gets 10-99%
+                progress = (i - 1) / total_mods * 10
                 
-                # Check if the viewing folder exists
-                if not os.path.exists(source_folder):
-                    progress_dialog.append_log(f"⚠️ [{i}/{total_mods}] {mod_name} not extracted yet - skipping")
-                    progress_dialog.append_log(f"   💡 Tip: View this mod in the 'Files' tab first to extract it")
+                if not os.path.exists(mod_path):
+                    progress_dialog.append_log(f"⚠️ [{i}/{total_mods}] {mod_name} not found - skipping")
                     continue
                 
-                progress_dialog.set_status(f"Copying mod {i}/{total_mods}: {mod_name}, please wait.")
+                progress_dialog.set_status(f"Reading mod {i}/{total_mods}: {mod_name}, please wait.")
                 progress_dialog.set_progress(progress)
-                progress_dialog.append_log(f"\n📋 [{i}/{total_mods}] Copying: {mod_name}")
+                progress_dialog.append_log(f"\n📋 [{i}/{total_mods}] Reading: {mod_name}")
                 
-                # Count files in the source folder
-                mod_files = sum(1 for _, _, files in os.walk(source_folder) for _ in files)
-                total_files += mod_files
-                progress_dialog.append_log(f"   ℹ️  Found {mod_files} files in {os.path.basename(source_folder)}")
+                try:
+                    mod_files = len(list_pak(mod_path))
+                except Exception as e:
+                    progress_dialog.append_log(f"⚠️ [{i}/{total_mods}] {mod_name} could not be read ({str(e)}) - skipping")
+                    continue
                 
-                # Copy files to merged directory
-                new_files = self.copy_tree_tracked(source_folder, merge_dir, progress_dialog)
-                files_copied += new_files
-                progress_dialog.append_log(f"   ✓ Copied {new_files} files to merge folder")
+                total_files += mod_files
+                mods_to_merge.append(mod_path)
+                progress_dialog.append_log(f"   ℹ️  Found {mod_files} files")
             
             if progress_dialog.was_cancelled:
                 progress_dialog.append_log("⚠️ Merge cancelled by user")
                 self.root.after(0, lambda: self._cleanup_and_close(progress_dialog, cancelled=True))
                 return
             
-            # Check if any files were actually copied
-            if files_copied == 0:
-                raise Exception("No mod files were copied! Make sure to view your mods in the 'Files' tab first to extract them.")
+            if not mods_to_merge:
+                raise Exception("None of the enabled mods could be read!")
             
-            # Pack the merged directory using pak_tool
+            # Merge the PAK files, copying compressed chunks straight across
             progress_dialog.set_status("Creating final patch.pak, please wait.")
-            progress_dialog.set_progress(90)
-            progress_dialog.append_log(f"\n📦 Packing merged files into {self.output_path}...")
+            progress_dialog.set_progress(10)
+            progress_dialog.append_log(f"\n📦 Merging into {self.output_path}...")
+            
+            shown_percent = [10]
+            
+            def on_merge_progress(event):
+                if event.kind == 'progress' and event.files_total:
+                    percent = 10 + int(event.files_done * 89 / event.files_total)
+                    # Only touch the dialog when the shown value changes
+                    if percent != shown_percent[0]:
+                        shown_percent[0] = percent
+                        progress_dialog.set_status(f"Merging file {event.files_done}/{event.files_total}, please wait.")
+                        progress_dialog.set_progress(percent)
+                elif event.kind == 'phase' and event.phase == 'metadata':
+                    progress_dialog.set_status("Writing patch.pak index, please wait.")
+                elif event.kind == 'error':
+                    progress_dialog.append_log(f"   ⚠️ {event.message}")
             
             try:
-                # Call pack_pak directly
-                success = pack_pak(merge_dir, self.output_path, use_compression=True, use_parallel=False)
-                if not success:
-                    raise Exception("pack_pak returned False")
+                success = merge_paks(mods_to_merge, self.output_path, progress=on_merge_progress,
+                                     cancel_token=progress_dialog.cancel_token)
             except Exception as e:
                 raise Exception(f"Failed to create patch.pak: {str(e)}")
             
+            if success.cancelled:
+                progress_dialog.append_log("⚠️ Merge cancelled by user - the previous patch.pak was kept")
+                self.root.after(0, lambda: self._cleanup_and_close(progress_dialog, cancelled=True))
+                return
+            if not success:
+                raise Exception("Failed to create patch.pak: merge_paks returned False")
+            
             progress_dialog.append_log(f"   ✓ Created {self.output_path}")
             
             # Clear cache so it will reload from disk
@@ -1806,7 +1696,7 @@ class ModManager:
             # Success
             progress_dialog.set_status("Complete!")
             progress_dialog.set_progress(100)
-            progress_dialog.append_log(f"\n✅ SUCCESS! Merged {total_mods} mods with {files_copied} total files")
+            progress_dialog.append_log(f"\n✅ SUCCESS! Merged {len(mods_to_merge)} mods with {total_files} total files")
             progress_dialog.append_log(f"📄 Output: {self.output_path}")
             
             # Update main window status
@@ -1815,7 +1705,7 @@ class ModManager:
             # Mark complete and show success message
             progress_dialog.mark_complete()
             self.root.after(0, lambda: MergeCompleteMessageBox(self.root, "Success",
-                        f"Merged patch.pak created successfully!\n\n{total_mods} mods merged\n{files_copied} files processed\n\nFile: {self.output_path}", 
+                        f"Merged patch.pak created successfully!\n\n{len(mods_to_merge)} mods merged\n{total_files} files processed\n\nFile: {self.output_path}", 
                         self.merged_folder))
             
         except Exception as e:
@@ -1827,45 +1717,14 @@ class ModManager:
             self.root.after(0, lambda: self.status_var.set("❌ Error occurred during merge"))
             self.root.after(0, lambda msg=error_msg: ModernMessageBox(self.root, "Error",
                         f"An error occurred:\n\n{msg}", "error"))
-            
-            if self.temp_dir and os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
 
     def _cleanup_and_close(self, progress_dialog, cancelled=False):
         """Cleanup after cancellation"""
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-            self.temp_dir = None
-        
         if cancelled:
             self.status_var.set("⚠️ Merge cancelled")
         
         progress_dialog.mark_complete()
     
-    def copy_tree_tracked(self, src, dst, progress_dialog=None, _accumulated_count=0):
-        """Recursively copy files with tracking for progress dialog"""
-        files_copied = 0
-        
-        for item in os.listdir(src):
-            src_path = os.path.join(src, item)
-            dst_path = os.path.join(dst, item)
-            
-            if os.path.isdir(src_path):
-                os.makedirs(dst_path, exist_ok=True)
-                files_copied += self.copy_tree_tracked(src_path, dst_path, progress_dialog, _accumulated_count + files_copied)
-            else:
-                shutil.copy2(src_path, dst_path)
-                files_copied += 1
-                
-                # Calculate total files copied so far
-                total_copied = _accumulated_count + files_copied
-                
-                # Log every 500 files
-                if progress_dialog and total_copied % 500 == 0:
-                    progress_dialog.append_log(f"      Copying {total_copied} files merge folder.")
-        
-        return files_copied
-    
     def save_config(self):
         config = {
             "mods": self.mods,
@@ -1889,20 +1748,9 @@ class ModManager:
                 for mod in self.mods:
                     if mod not in self.mod_enabled:
                         self.mod_enabled[mod] = True
-                
-                # Auto-extract mods that haven't been extracted yet
-                self.root.after(1000, self.auto_extract_mods)
             except Exception as e:
                 print(f"Failed to load config: {e}")
 
-    def auto_extract_mods(self):
-        """Auto-extract all mods that haven't been extracted yet"""
-        for mod_path in self.mods:
-            if os.path.exists(mod_path):
-                viewing_dir = self.get_viewing_dir_for_mod(mod_path)
-                if not os.path.exists(viewing_dir):
-                    self.unpack_mod_for_viewing(mod_path)
-
 if __name__ == "__main__":
     multiprocessing.freeze_support()  # Required for Windows
     root = tk.Tk()
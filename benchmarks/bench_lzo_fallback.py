@@ -0,0 +1,75 @@
+"""
+Compare the built-in pure-Python LZO decoder against the native backend.
+
+Packs a synthetic mod into a temporary PAK file, then decodes every entry
+with each backend and reports MB/s of decoded output, so the cost of the
+fallback path is known before relying on it.
+
+Usage: python benchmarks/bench_lzo_fallback.py [--files N] [--file-size BYTES]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pak_tool
+import synthetic
+
+
+def time_decode(pak_path, rounds):
+    """Best wall time to decode every entry, plus the number of bytes decoded"""
+    best = None
+    total_bytes = 0
+    with pak_tool.PakReader(pak_path) as reader:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            total_bytes = sum(len(reader.read_entry(entry)) for entry in reader.entries)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best, total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=200, help="number of files in the synthetic pak")
+    parser.add_argument('--file-size', type=int, default=256 * 1024, help="size of each file in bytes")
+    parser.add_argument('--rounds', type=int, default=3, help="decode passes per backend, best is kept")
+    args = parser.parse_args()
+    
+    if not pak_tool.load_dlls():
+        return 1
+    native = pak_tool.get_lzo_backend()
+    if native == 'python':
+        native = None
+        print("No native LZO backend available - the pak will only contain stored chunks,")
+        print("so the fallback numbers below do not include any LZO decoding.\n")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tree = os.path.join(temp_dir, 'mod')
+        pak_path = os.path.join(temp_dir, 'patch.pak')
+        synthetic.make_tree(tree, args.files, mean_size=args.file_size, distribution='fixed')
+        if not pak_tool.pack_pak(tree, pak_path):
+            print("ERROR: Packing the synthetic mod failed")
+            return 1
+        
+        print(f"Synthetic pak: {args.files} files, {pak_tool.format_size(os.path.getsize(pak_path))} on disk\n")
+        
+        results = {}
+        for backend in ([native] if native else []) + ['python']:
+            pak_tool.load_dlls(backend)
+            elapsed, total_bytes = time_decode(pak_path, args.rounds)
+            results[backend] = elapsed
+            print(f"{backend:>10}: {total_bytes / 1_048_576 / elapsed:8.2f} MB/s "
+                  f"({elapsed:.3f} s for {pak_tool.format_size(total_bytes)})")
+        
+        if native:
+            print(f"\nFallback is {results['python'] / results[native]:.1f}x slower than {native}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
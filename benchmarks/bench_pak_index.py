@@ -0,0 +1,150 @@
+"""
+Measure how long it takes to parse the index of a very large PAK, and how
+much memory it holds.
+
+Writes a synthetic PAK with many tiny stored entries straight to disk (no
+source tree needed), then times _read_pak_metadata and reports the memory
+held by the columnar PakIndex next to the parser it replaced, which read
+every field with struct.unpack into one dict per entry (kept below as
+read_metadata_baseline).
+
+Usage: python benchmarks/bench_pak_index.py [--entries N]
+"""
+import argparse
+import binascii
+import gc
+import io
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pak_tool
+
+
+def write_synthetic_pak(pak_path, entry_count, entry_size=16):
+    """Write entry_count stored entries of entry_size bytes each"""
+    payload = b'x' * entry_size
+    chunk_header = struct.pack("<HH", pak_tool.stored_chunk_size(entry_size, 65535), 65535)
+    meta_part_1 = bytearray()
+    meta_part_2 = bytearray()
+    
+    with open(pak_path, 'wb') as pak_file:
+        pak_file.write(b'PAK!' + struct.pack("<II", 4, 0))
+        for n in range(entry_count):
+            path = f"graphics\\dir{n % 64}\\sub{n % 7}\\entity_{n:07d}.xml".encode('utf-8')
+            meta_part_1 += struct.pack("<III", pak_file.tell(), entry_size, binascii.crc32(path))
+            meta_part_1 += chunk_header
+            meta_part_2 += struct.pack("<QB", 133000000000000000 + n, len(path)) + path
+            pak_file.write(payload)
+        pak_tool.write_pak_metadata(pak_file, entry_count, meta_part_1, meta_part_2, pak_file.tell())
+
+
+def read_metadata_baseline(input_file):
+    """The metadata parser before PakIndex: one struct.unpack per field, one dict per entry"""
+    max_chunk_size = 65536
+    
+    with open(input_file, 'rb') as f:
+        f.seek(8)
+        offset_to_metadata = struct.unpack("<I", f.read(4))[0]
+        
+        f.seek(offset_to_metadata)
+        metadata_size = struct.unpack("<I", f.read(4))[0]
+        f.seek(offset_to_metadata + metadata_size)
+        number_of_chunks = struct.unpack("<I", f.read(4))[0]
+        
+        chunk_headers = io.BytesIO(f.read())
+        f.seek(offset_to_metadata)
+        
+        last_offset = 0
+        last_decompressed_size = 0
+        metadata_parts = []
+        for n in range(number_of_chunks):
+            decompressed_size = struct.unpack("<I", chunk_headers.read(4))[0]
+            second_header_part = chunk_headers.read(4)
+            offset = struct.unpack("<I", second_header_part[:3] + b'\x00')[0]
+            _data_ = f.read(offset - last_offset)
+            if decompressed_size != last_decompressed_size:
+                metadata_parts.append(zlib.decompress(_data_))
+            last_offset = offset
+            last_decompressed_size = decompressed_size
+    
+    metadata = io.BytesIO(b''.join(metadata_parts))
+    metadata.read(1)
+    number_of_files = struct.unpack("<I", metadata.read(4))[0]
+    
+    entries = []
+    for n in range(number_of_files):
+        entry = {}
+        entry['file_offset'] = struct.unpack("<I", metadata.read(4))[0]
+        file_size = struct.unpack("<I", metadata.read(4))[0]
+        entry['file_size'] = file_size
+        entry['file_name_hash'] = struct.unpack("<I", metadata.read(4))[0]
+        
+        file_chunks = file_size // max_chunk_size
+        if file_size % max_chunk_size != 0:
+            file_chunks += 1
+        
+        entry['chunk_headers'] = []
+        for _ in range(file_chunks):
+            entry['chunk_headers'].append(struct.unpack("<HH", metadata.read(4)))
+        entries.append(entry)
+    
+    for entry in entries:
+        entry['creation_date'] = struct.unpack("<Q", metadata.read(8))[0]
+        path_len = struct.unpack("<B", metadata.read(1))[0]
+        entry['path'] = metadata.read(path_len).decode('utf-8')
+    
+    return entries
+
+
+def measure(build, rounds):
+    """Best wall time of build() and the peak memory traced while it ran"""
+    best = None
+    for _ in range(rounds):
+        gc.collect()
+        start = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del result
+    
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, current, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=200_000, help="number of entries in the synthetic pak")
+    parser.add_argument('--rounds', type=int, default=3, help="parse passes, best is kept")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pak_path = os.path.join(temp_dir, 'patch.pak')
+        write_synthetic_pak(pak_path, args.entries)
+        print(f"Synthetic pak: {args.entries} entries, {pak_tool.format_size(os.path.getsize(pak_path))} on disk\n")
+        
+        elapsed, current, peak, index = measure(lambda: pak_tool._read_pak_metadata(pak_path), args.rounds)
+        print(f"PakIndex:       parse {elapsed:.3f} s, holds {pak_tool.format_size(current)} "
+              f"(peak {pak_tool.format_size(peak)}, columns {pak_tool.format_size(index.nbytes)})")
+        
+        elapsed, current, peak, entries = measure(lambda: read_metadata_baseline(pak_path), args.rounds)
+        print(f"Baseline:       parse {elapsed:.3f} s, holds {pak_tool.format_size(current)} "
+              f"(peak {pak_tool.format_size(peak)}, struct.unpack loop, dict per entry)")
+        # PakIndex entries also carry their position as 'index'
+        if entries != [{key: value for key, value in entry.items() if key != 'index'} for entry in index]:
+            print("WARNING: baseline and PakIndex entries differ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Benchmark pack, unpack, list and merge on synthetic mods.
+
+Generates mod trees with benchmarks/synthetic.py, then runs each operation
+in a fresh process so its peak RSS can be measured on its own. Reports
+wall time, MB/s, files/s and peak RSS per operation, plus the LZO backend
+in use, and can write everything as JSON to compare runs across commits.
+Runs headless on Linux - without the Windows DLLs it uses liblzo2,
+python-lzo or the pure-Python fallback, whichever load_dlls() picks.
+
+Usage: python benchmarks/bench_suite.py [--files N] [--mods N] [--json results.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pak_tool
+import synthetic
+
+OPERATIONS = ('pack', 'list', 'unpack', 'merge')
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, None where unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_operation(operation, backend, work_dir, paks, trees):
+    """
+    Run one operation and time it. Called in a child process; returns the
+    wall time, the number of files and (uncompressed) bytes it processed,
+    and the peak RSS of the child.
+    """
+    pak_tool.load_dlls(backend)
+    first_pak = paks[0]
+    
+    if operation == 'list':
+        # Cold list - parse the metadata, not a cached sidecar
+        sidecar = first_pak + pak_tool.PAK_INDEX_SUFFIX
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+    
+    start = time.perf_counter()
+    if operation == 'pack':
+        listed_pak = os.path.join(work_dir, 'packed.pak')
+        ok = pak_tool.pack_pak(trees[0], listed_pak)
+    elif operation == 'list':
+        listed_pak = first_pak
+        ok = bool(pak_tool.list_pak(first_pak))
+    elif operation == 'unpack':
+        listed_pak = first_pak
+        ok = pak_tool.unpack_pak(first_pak, os.path.join(work_dir, 'unpacked'))
+    elif operation == 'merge':
+        listed_pak = os.path.join(work_dir, 'merged.pak')
+        ok = pak_tool.merge_paks(paks, listed_pak)
+    else:
+        raise ValueError(f"Unknown operation: {operation}")
+    elapsed = time.perf_counter() - start
+    
+    if not ok:
+        raise RuntimeError(f"{operation} failed")
+    entries = pak_tool.list_pak(listed_pak)
+    
+    return {
+        'seconds': elapsed,
+        'files': len(entries),
+        'bytes': sum(entry['file_size'] for entry in entries),
+        'peak_rss': peak_rss(),
+    }
+
+
+def _child(queue, *args):
+    try:
+        queue.put(run_operation(*args))
+    except Exception as e:
+        queue.put({'error': str(e)})
+
+
+def run_isolated(context, *args):
+    """run_operation in a fresh interpreter, so peak RSS is its own"""
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(queue,) + args)
+    process.start()
+    result = queue.get()
+    process.join()
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=500, help="files per synthetic mod")
+    parser.add_argument('--mods', type=int, default=3, help="number of mods to merge")
+    parser.add_argument('--mean-size', type=int, default=64 * 1024, help="mean file size in bytes")
+    parser.add_argument('--distribution', choices=synthetic.SIZE_DISTRIBUTIONS, default='lognormal',
+                        help="file size distribution")
+    parser.add_argument('--compressibility', type=float, default=0.75,
+                        help="fraction of files that are text-like rather than random")
+    parser.add_argument('--overlap', type=float, default=0.25,
+                        help="fraction of each mod's paths shared with the other mods")
+    parser.add_argument('--rounds', type=int, default=3, help="runs per operation, best is kept")
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=list(OPERATIONS))
+    parser.add_argument('--json', help="write the results to this JSON file")
+    args = parser.parse_args()
+    
+    if not pak_tool.load_dlls():
+        return 1
+    backend = pak_tool.get_lzo_backend()
+    print(f"LZO backend: {backend}")
+    if not pak_tool.can_compress_lzo():
+        print("(stored-only fallback - packs will not be compressed)")
+    
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        trees = synthetic.make_mods(os.path.join(temp_dir, 'mods'), args.mods, args.files,
+                                    overlap=args.overlap, mean_size=args.mean_size,
+                                    distribution=args.distribution, compressibility=args.compressibility)
+        paks = synthetic.make_paks(trees, os.path.join(temp_dir, 'paks'))
+        print(f"Synthetic mods: {args.mods} x {args.files} files, "
+              f"{pak_tool.format_size(os.path.getsize(paks[0]))} per pak\n")
+        
+        for operation in args.operations:
+            best = None
+            for _ in range(args.rounds):
+                work_dir = os.path.join(temp_dir, 'work')
+                shutil.rmtree(work_dir, ignore_errors=True)
+                os.makedirs(work_dir)
+                result = run_isolated(context, operation, backend, work_dir, paks, trees)
+                if best is None or result['seconds'] < best['seconds']:
+                    best = result
+            
+            best['mb_per_second'] = best['bytes'] / 1_048_576 / best['seconds']
+            best['files_per_second'] = best['files'] / best['seconds']
+            results[operation] = best
+            rss = pak_tool.format_size(best['peak_rss']) if best['peak_rss'] else 'n/a'
+            print(f"{operation:>7}: {best['seconds']:7.3f} s  {best['mb_per_second']:8.2f} MB/s  "
+                  f"{best['files_per_second']:9.0f} files/s  peak RSS {rss}")
+    
+    if args.json:
+        report = {
+            'commit': git_commit(),
+            'backend': backend,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'config': {key: value for key, value in vars(args).items() if key != 'json'},
+            'results': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
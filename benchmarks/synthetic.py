@@ -0,0 +1,99 @@
+"""
+Synthetic mod trees and PAK files for the benchmarks.
+
+Trees mix text-like files (compress well with LZO) and random ones (do not
+compress at all, like DXT textures or audio), with a configurable size
+distribution. make_mods builds several mods whose paths partly overlap, so
+merges have real conflicts to resolve.
+"""
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pak_tool
+
+SIZE_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+_WORDS = [b'pandora', b'navi', b'avatar', b'rda', b'<entity>', b'</entity>', b'0.500', b'\r\n']
+
+
+def file_sizes(rng, count, mean_size, distribution):
+    """count file sizes with the given mean, drawn from one of SIZE_DISTRIBUTIONS"""
+    if distribution == 'fixed':
+        return [mean_size] * count
+    if distribution == 'uniform':
+        return [rng.randint(0, 2 * mean_size) for _ in range(count)]
+    if distribution == 'lognormal':
+        # Most files small, a few very large - like real mods
+        sigma = 1.2
+        mu = max(0.0, math.log(mean_size) - sigma * sigma / 2)
+        return [max(1, int(rng.lognormvariate(mu, sigma))) for _ in range(count)]
+    raise ValueError(f"Unknown size distribution: {distribution}")
+
+
+def file_data(rng, size, compressible):
+    if compressible:
+        return b' '.join(rng.choice(_WORDS) for _ in range(size // 4 + 1))[:size]
+    return rng.randbytes(size)
+
+
+def file_path(n):
+    """Relative path of the n-th file in the shared synthetic namespace"""
+    if n % 4 == 3:
+        return os.path.join('graphics', f"dir{n % 16}", f"texture{n}.xbt")
+    return os.path.join('entities', f"dir{n % 16}", f"entity{n}.xml")
+
+
+def make_tree(root, file_count, mean_size=64 * 1024, distribution='lognormal',
+              compressibility=0.75, seed=2014, file_numbers=None):
+    """
+    Write a synthetic mod tree. compressibility is the fraction of files
+    that are text-like; the rest are random bytes. file_numbers picks which
+    paths of the shared namespace are used (default: the first file_count).
+    Returns the total number of bytes written.
+    """
+    rng = random.Random(seed)
+    if file_numbers is None:
+        file_numbers = range(file_count)
+    sizes = file_sizes(rng, len(file_numbers), mean_size, distribution)
+    
+    total_bytes = 0
+    for n, size in zip(file_numbers, sizes):
+        path = os.path.join(root, file_path(n))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(file_data(rng, size, rng.random() < compressibility))
+        total_bytes += size
+    return total_bytes
+
+
+def make_mods(root, mod_count, files_per_mod, overlap=0.25, seed=2014, **tree_options):
+    """
+    Write mod_count trees under root (mod0, mod1, ...). overlap is the
+    fraction of each mod's files whose paths also appear in the other mods.
+    Returns the list of tree folders.
+    """
+    shared = int(files_per_mod * overlap)
+    own = files_per_mod - shared
+    trees = []
+    for mod in range(mod_count):
+        numbers = list(range(shared)) + list(range(shared + mod * own, shared + (mod + 1) * own))
+        tree = os.path.join(root, f"mod{mod}")
+        make_tree(tree, files_per_mod, seed=seed + mod, file_numbers=numbers, **tree_options)
+        trees.append(tree)
+    return trees
+
+
+def make_paks(trees, output_folder):
+    """Pack each tree into <output_folder>/<tree name>.pak, returns the pak paths"""
+    os.makedirs(output_folder, exist_ok=True)
+    paks = []
+    for tree in trees:
+        pak_path = os.path.join(output_folder, os.path.basename(tree) + '.pak')
+        if not pak_tool.pack_pak(tree, pak_path):
+            raise RuntimeError(f"Packing {tree} failed")
+        paks.append(pak_path)
+    return paks
@@ -1,12 +1,22 @@
 import os
 import sys
 import binascii
+import collections
+import hashlib
+import json
 import struct
 import zlib
 import io
-from io import BytesIO
 import ctypes
+import ctypes.util
 import datetime
+import fnmatch
+import re
+from array import array
+import mmap
+import sqlite3
+import threading
+import time
 from ctypes import (
     c_char_p,
     c_size_t,
@@ -16,7 +26,7 @@ from ctypes import (
     CDLL,
     byref,
 )
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 import multiprocessing
 
 # Platform-specific imports for Windows file time handling
@@ -27,315 +37,2249 @@ try:
 except ImportError:
     WINDOWS_AVAILABLE = False
 
-# Global LZO DLL variables
+# Global LZO DLL variables (set when the bundled minilzo DLLs are in use)
 lzo_compress = None
 lzo_decompress = None
 
+# Active LZO backend, chosen by load_dlls()
+lzo_backend = None
 
-def load_dlls():
-    """Load the appropriate LZO DLLs based on system architecture"""
-    global lzo_compress, lzo_decompress
+
+class LzoBackend:
+    """
+    One way of running LZO1X - a name plus compress/decompress callables.
+    compress is None for a stored-only backend, which can decode LZO but
+    makes pack_pak write every chunk uncompressed. decompress_into, when
+    given, decodes straight into a slice of a caller-owned bytearray.
+    """
     
-    is_64bit = sys.maxsize > 2**32
+    def __init__(self, name, compress, decompress, decompress_into=None):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+        self.decompress_into = decompress_into
     
+    def __repr__(self):
+        return f"LzoBackend({self.name!r})"
+
+
+def _get_app_dir():
     # Get the directory where the exe/script is located
     if getattr(sys, 'frozen', False):
         # Running as compiled exe
-        app_dir = os.path.dirname(sys.executable)
+        return os.path.dirname(sys.executable)
+    # Running as script
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+class _PyBuffer(ctypes.Structure):
+    """Py_buffer, as filled in by PyObject_GetBuffer"""
+    _fields_ = [
+        ('buf', ctypes.c_void_p),
+        ('obj', ctypes.c_void_p),
+        ('len', ctypes.c_ssize_t),
+        ('itemsize', ctypes.c_ssize_t),
+        ('readonly', c_int),
+        ('ndim', c_int),
+        ('format', c_char_p),
+        ('shape', ctypes.c_void_p),
+        ('strides', ctypes.c_void_p),
+        ('suboffsets', ctypes.c_void_p),
+        ('internal', ctypes.c_void_p),
+    ]
+
+
+try:
+    _PyObject_GetBuffer = ctypes.pythonapi.PyObject_GetBuffer
+    _PyObject_GetBuffer.argtypes = [ctypes.py_object, POINTER(_PyBuffer), c_int]
+    _PyObject_GetBuffer.restype = c_int
+    _PyBuffer_Release = ctypes.pythonapi.PyBuffer_Release
+    _PyBuffer_Release.argtypes = [POINTER(_PyBuffer)]
+    _PyBuffer_Release.restype = None
+except AttributeError:
+    # Not CPython - buffers are copied instead
+    _PyObject_GetBuffer = None
+
+
+def _as_c_buffer(data):
+    """
+    Pass bytes straight through to ctypes. Other buffers, such as slices of
+    a read-only PakReader mapping, are passed by address instead of copied;
+    the caller's reference to data keeps the memory alive for the call.
+    """
+    if isinstance(data, bytes) or _PyObject_GetBuffer is None:
+        return bytes(data)
+    view = _PyBuffer()
+    _PyObject_GetBuffer(data, byref(view), 0)  # PyBUF_SIMPLE
+    try:
+        return ctypes.cast(view.buf, c_char_p)
+    finally:
+        _PyBuffer_Release(byref(view))
+
+
+def _load_liblzo2():
+    """Native liblzo2 shared library (Linux/macOS) through ctypes"""
+    if os.name == 'nt':
+        return None
+    
+    names = ['liblzo2.so.2', 'liblzo2.so', 'liblzo2.2.dylib', 'liblzo2.dylib']
+    found = ctypes.util.find_library('lzo2')
+    if found:
+        names.insert(0, found)
+    
+    lib = None
+    for name in names:
+        try:
+            lib = CDLL(name)
+            break
+        except OSError:
+            continue
+    if lib is None:
+        return None
+    
+    lib.lzo1x_1_compress.argtypes = [
+        c_char_p, c_size_t, c_char_p, POINTER(c_size_t), ctypes.c_void_p
+    ]
+    lib.lzo1x_1_compress.restype = c_int
+    lib.lzo1x_decompress_safe.argtypes = [
+        c_char_p, c_size_t, c_char_p, POINTER(c_size_t), ctypes.c_void_p
+    ]
+    lib.lzo1x_decompress_safe.restype = c_int
+    
+    # LZO1X_1_MEM_COMPRESS work memory, one buffer per compressing thread
+    wrkmem_size = 16384 * ctypes.sizeof(ctypes.c_void_p)
+    local = threading.local()
+    
+    def compress(data):
+        wrkmem = getattr(local, 'wrkmem', None)
+        if wrkmem is None:
+            wrkmem = local.wrkmem = create_string_buffer(wrkmem_size)
+        src_len = len(data)
+        dst_len = c_size_t(src_len + src_len // 16 + 64 + 3)
+        dst_buf = create_string_buffer(dst_len.value)
+        result = lib.lzo1x_1_compress(_as_c_buffer(data), src_len, dst_buf, byref(dst_len), wrkmem)
+        if result != 0:
+            raise RuntimeError(f"LZO compression failed (code {result})")
+        return dst_buf.raw[:dst_len.value]
+    
+    def decompress(src_data, expected_size):
+        dst_len = c_size_t(expected_size)
+        dst_buf = create_string_buffer(expected_size)
+        result = lib.lzo1x_decompress_safe(_as_c_buffer(src_data), len(src_data), dst_buf, byref(dst_len), None)
+        if result != 0:
+            raise RuntimeError(f"LZO decompression failed (code {result})")
+        return dst_buf.raw[:dst_len.value]
+    
+    def decompress_into(src_data, dst, dst_offset, max_size):
+        dst_len = c_size_t(max_size)
+        dst_buf = (ctypes.c_char * max_size).from_buffer(dst, dst_offset)
+        result = lib.lzo1x_decompress_safe(_as_c_buffer(src_data), len(src_data), dst_buf, byref(dst_len), None)
+        if result != 0:
+            raise RuntimeError(f"LZO decompression failed (code {result})")
+        return dst_len.value
+    
+    return LzoBackend('liblzo2', compress, decompress, decompress_into)
+
+
+def _load_python_lzo():
+    """The python-lzo extension module, if installed"""
+    try:
+        import lzo
+    except ImportError:
+        return None
+    
+    def compress(data):
+        return lzo.compress(bytes(data), 1, False)
+    
+    def decompress(src_data, expected_size):
+        return lzo.decompress(bytes(src_data), False, expected_size)
+    
+    return LzoBackend('python-lzo', compress, decompress)
+
+
+def _load_minilzo_dlls():
+    """Load the appropriate bundled minilzo DLLs based on system architecture"""
+    global lzo_compress, lzo_decompress
+    
+    is_64bit = sys.maxsize > 2**32
+    app_dir = _get_app_dir()
+    
+    dll_c_name = 'minilzo_c_x64.dll' if is_64bit else 'minilzo_c_x86.dll'
+    dll_d_name = 'minilzo_d_x64.dll' if is_64bit else 'minilzo_d_x86.dll'
+    
+    dll_c_path = os.path.join(app_dir, dll_c_name)
+    dll_d_path = os.path.join(app_dir, dll_d_name)
+    
+    # Try generic names if specific not found
+    if not os.path.exists(dll_c_path):
+        dll_c_path = os.path.join(app_dir, 'minilzo_c.dll')
+    if not os.path.exists(dll_d_path):
+        dll_d_path = os.path.join(app_dir, 'minilzo_d.dll')
+    
+    try:
+        compress_dll = CDLL(dll_c_path)
+        compress_dll.lzo1x_compress_simple.argtypes = [
+            c_char_p, c_size_t, c_char_p, POINTER(c_size_t)
+        ]
+        compress_dll.lzo1x_compress_simple.restype = c_int
+        
+        decompress_dll = CDLL(dll_d_path)
+        decompress_dll.lzo_decompress.argtypes = [
+            c_char_p, c_size_t, c_char_p, POINTER(c_size_t)
+        ]
+        decompress_dll.lzo_decompress.restype = c_int
+    except Exception:
+        return None
+    
+    def compress(data):
+        src_len = len(data)
+        dst_len = c_size_t(src_len + src_len // 16 + 64 + 3)
+        dst_buf = create_string_buffer(dst_len.value)
+
+        result = compress_dll.lzo1x_compress_simple(
+            _as_c_buffer(data),
+            src_len,
+            dst_buf,
+            byref(dst_len)
+        )
+
+        if result != 0:
+            raise RuntimeError(f"LZO compression failed (code {result})")
+
+        return dst_buf.raw[:dst_len.value]
+
+    def decompress(src_data, expected_size):
+        src_len = len(src_data)
+        dst_len = c_size_t(expected_size)
+        dst_buf = create_string_buffer(expected_size)
+
+        result = decompress_dll.lzo_decompress(
+            _as_c_buffer(src_data),
+            src_len,
+            dst_buf,
+            byref(dst_len)
+        )
+        if result != 0:
+            raise RuntimeError(f"LZO decompression failed (code {result})")
+
+        return dst_buf.raw[:dst_len.value]
+
+    def decompress_into(src_data, dst, dst_offset, max_size):
+        dst_len = c_size_t(max_size)
+        dst_buf = (ctypes.c_char * max_size).from_buffer(dst, dst_offset)
+
+        result = decompress_dll.lzo_decompress(
+            _as_c_buffer(src_data),
+            len(src_data),
+            dst_buf,
+            byref(dst_len)
+        )
+        if result != 0:
+            raise RuntimeError(f"LZO decompression failed (code {result})")
+
+        return dst_len.value
+    
+    lzo_compress = compress_dll
+    lzo_decompress = decompress_dll
+    return LzoBackend('minilzo', compress, decompress, decompress_into)
+
+
+def _lzo1x_decompress_python(src_data, expected_size):
+    """
+    Pure-Python LZO1X decoder (same bitstream as lzo1x_decompress_safe).
+    Slow, but lets listing, verifying and previewing work without any
+    native LZO library.
+    """
+    src = bytes(src_data)
+    src_len = len(src)
+    out = bytearray()
+    ip = 0
+    state = 0
+    
+    try:
+        if src[0] > 17:
+            t = src[0] - 17
+            ip = 1
+            if ip + t > src_len:
+                raise RuntimeError("LZO decompression failed (input overrun)")
+            out += src[ip:ip + t]
+            ip += t
+            # A short first run continues as if it followed a match
+            state = t if t < 4 else 4
+        
+        while True:
+            t = src[ip]
+            ip += 1
+            
+            if t < 16:
+                if state == 0:
+                    # Literal run
+                    if t == 0:
+                        zeros_start = ip
+                        while src[ip] == 0:
+                            ip += 1
+                        t = (ip - zeros_start) * 255 + 15 + src[ip]
+                        ip += 1
+                    t += 3
+                    if ip + t > src_len:
+                        raise RuntimeError("LZO decompression failed (input overrun)")
+                    out += src[ip:ip + t]
+                    ip += t
+                    state = 4
+                    continue
+                
+                if state != 4:
+                    # M1 - two byte match right after a short literal run
+                    next_literals = t & 3
+                    m_pos = len(out) - 1 - (t >> 2) - (src[ip] << 2)
+                    ip += 1
+                    length = 2
+                else:
+                    # M1 after a long literal run - three byte match
+                    next_literals = t & 3
+                    m_pos = len(out) - (1 + 0x0800) - (t >> 2) - (src[ip] << 2)
+                    ip += 1
+                    length = 3
+            elif t >= 64:
+                # M2
+                next_literals = t & 3
+                m_pos = len(out) - 1 - ((t >> 2) & 7) - (src[ip] << 3)
+                ip += 1
+                length = (t >> 5) + 1
+            elif t >= 32:
+                # M3
+                length = (t & 31) + 2
+                if length == 2:
+                    zeros_start = ip
+                    while src[ip] == 0:
+                        ip += 1
+                    length += (ip - zeros_start) * 255 + 31 + src[ip]
+                    ip += 1
+                distance = src[ip] | (src[ip + 1] << 8)
+                ip += 2
+                m_pos = len(out) - 1 - (distance >> 2)
+                next_literals = distance & 3
+            else:
+                # M4, or the end of stream marker
+                m_pos = len(out) - ((t & 8) << 11)
+                length = (t & 7) + 2
+                if length == 2:
+                    zeros_start = ip
+                    while src[ip] == 0:
+                        ip += 1
+                    length += (ip - zeros_start) * 255 + 7 + src[ip]
+                    ip += 1
+                distance = src[ip] | (src[ip + 1] << 8)
+                ip += 2
+                m_pos -= distance >> 2
+                next_literals = distance & 3
+                if m_pos == len(out):
+                    break
+                m_pos -= 0x4000
+            
+            # Copy the match, which may overlap the bytes it produces
+            if m_pos < 0:
+                raise RuntimeError("LZO decompression failed (lookbehind overrun)")
+            distance = len(out) - m_pos
+            if distance >= length:
+                out += out[m_pos:m_pos + length]
+            else:
+                pattern = out[m_pos:]
+                out += (pattern * (length // distance + 1))[:length]
+            
+            if len(out) > expected_size:
+                raise RuntimeError("LZO decompression failed (output overrun)")
+            
+            # Up to three literals trail every match
+            state = next_literals
+            if ip + next_literals > src_len:
+                raise RuntimeError("LZO decompression failed (input overrun)")
+            out += src[ip:ip + next_literals]
+            ip += next_literals
+    except IndexError:
+        raise RuntimeError("LZO decompression failed (input overrun)")
+    
+    if length != 3 or ip != src_len:
+        raise RuntimeError("LZO decompression failed (bad end of stream)")
+    if len(out) > expected_size:
+        raise RuntimeError("LZO decompression failed (output overrun)")
+    return bytes(out)
+
+
+def _load_python_fallback():
+    """Built-in pure-Python decoder with a stored-only compressor, always available"""
+    return LzoBackend('python', None, _lzo1x_decompress_python)
+
+
+# Candidate backends in order of preference
+LZO_BACKEND_LOADERS = [
+    ('liblzo2', _load_liblzo2),
+    ('python-lzo', _load_python_lzo),
+    ('minilzo', _load_minilzo_dlls),
+    ('python', _load_python_fallback),
+]
+
+# Known-good LZO1X stream used to check every backend's decoder
+_LZO_TEST_VECTOR = (
+    b"Pandora " + b"na'vi " * 12 + b"avatar avatar avatar! 0123456789" * 3,
+    b'\nPandora na\'vi "\x14\x00\x04avatar +\x18\x00\t! 0123456789+`\x00\xd8\x04:|\x00'
+    b'\ratar! 0123456789\x11\x00\x00',
+)
+
+
+def _benchmark_lzo_backend(backend, rounds=3):
+    """
+    Round-trip a synthetic 64 KiB chunk through a backend. Returns the best
+    time in seconds, or None if the backend fails or corrupts the data.
+    Stored-only backends are only checked against the known test vector.
+    """
+    raw, compressed = _LZO_TEST_VECTOR
+    try:
+        if backend.decompress(compressed, 65536) != raw:
+            return None
+    except Exception:
+        return None
+    if backend.compress is None:
+        return float('inf')
+    
+    sample = b''.join(struct.pack("<I", (n * 2654435761) & 0xFFF) + b'avatar' for n in range(6554))[:65536]
+    best = None
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            compressed = backend.compress(sample)
+            restored = backend.decompress(compressed, 65536)
+            elapsed = time.perf_counter() - start
+            if restored != sample:
+                return None
+            best = elapsed if best is None else min(best, elapsed)
+    except Exception:
+        return None
+    return best
+
+
+def load_dlls(backend=None):
+    """
+    Pick the LZO backend used by compress_lzo/decompress_lzo. Every available
+    backend (system liblzo2, python-lzo, the bundled minilzo DLLs) is checked
+    with a quick round-trip benchmark and the fastest one wins; the built-in
+    pure-Python decoder is only used when none of them load. Pass a backend
+    name to force that one. Returns False if none could be loaded.
+    """
+    global lzo_backend
+    
+    timings = []
+    for name, loader in LZO_BACKEND_LOADERS:
+        if backend is not None and name != backend:
+            continue
+        candidate = loader()
+        if candidate is None:
+            continue
+        elapsed = _benchmark_lzo_backend(candidate)
+        if elapsed is not None:
+            timings.append((elapsed, candidate))
+    
+    if not timings:
+        wanted = backend or ', '.join(name for name, _ in LZO_BACKEND_LOADERS)
+        print(f"ERROR: Could not load an LZO backend ({wanted})")
+        return False
+    
+    # Stored-only backends rank last whatever their timing
+    lzo_backend = min(timings, key=lambda timing: (timing[1].compress is None, timing[0]))[1]
+    return True
+
+
+def get_lzo_backend():
+    """Name of the active LZO backend, or None if load_dlls() has not succeeded"""
+    return lzo_backend.name if lzo_backend is not None else None
+
+
+def can_compress_lzo():
+    """False when the active backend is stored-only (or none is loaded)"""
+    return lzo_backend is not None and lzo_backend.compress is not None
+
+
+def compress_lzo(data: bytes) -> bytes:
+    if lzo_backend.compress is None:
+        raise RuntimeError(f"LZO backend '{lzo_backend.name}' cannot compress")
+    return lzo_backend.compress(data)
+
+
+def decompress_lzo(src_data, expected_size: int) -> bytes:
+    return lzo_backend.decompress(src_data, expected_size)
+
+
+def decompress_lzo_into(src_data, dst, dst_offset, max_size):
+    """
+    Decode one chunk straight into dst[dst_offset:dst_offset + max_size]
+    (dst is a bytearray) and return the decoded length. Backends without a
+    native in-place path decode to bytes and copy once.
+    """
+    if lzo_backend.decompress_into is not None:
+        return lzo_backend.decompress_into(src_data, dst, dst_offset, max_size)
+    data = lzo_backend.decompress(src_data, max_size)
+    dst[dst_offset:dst_offset + len(data)] = data
+    return len(data)
+
+
+def filetime_to_datetime(filetime_int):
+    return datetime.datetime(1601, 1, 1) + datetime.timedelta(microseconds=filetime_int // 10)
+
+
+def set_creation_time(file_path, filetime_value):
+    if not WINDOWS_AVAILABLE:
+        return
+    
+    try:
+        dt = filetime_to_datetime(filetime_value)
+        wintime = pywintypes.Time(dt)
+        handle = win32file.CreateFile(
+            file_path, win32file.GENERIC_WRITE, 0, None,
+            win32file.OPEN_EXISTING, 0, None
+        )
+        win32file.SetFileTime(handle, wintime, None, wintime)
+        handle.close()
+    except:
+        pass
+
+
+def format_size(size_in_bytes):
+    size_in_bytes = int(size_in_bytes)
+    if size_in_bytes >= 1_048_576:
+        return f"{size_in_bytes / 1_048_576:.2f} MB"
+    else:
+        return f"{size_in_bytes / 1024:.2f} KB"
+
+
+def chunk_size_value(size, max_chunk_size):
+    if size == max_chunk_size:
+        size = 0
+    return size
+
+
+def pack_offset_and_flag(offset: int, flag: int) -> bytes:
+    offset_bytes = offset.to_bytes(3, byteorder="little")
+    flag_byte = struct.pack("<B", flag)
+    return offset_bytes + flag_byte
+
+
+def stored_chunk_size(chunk_size, compression_flag, max_chunk_size=65536):
+    """Number of bytes a chunk occupies in the archive, from its <HH> header"""
+    if compression_flag == 65535:
+        return 65536 - chunk_size
+    if chunk_size == 0:
+        return max_chunk_size
+    return chunk_size
+
+
+def decode_chunk(chunk_data, compression_flag, max_chunk_size=65536):
+    """Decode one chunk as stored in the archive"""
+    if compression_flag == 65535:
+        return chunk_data
+    return decompress_lzo(chunk_data, max_chunk_size)
+
+
+class OperationCancelled(Exception):
+    """Raised inside pack/unpack/merge when their CancelToken is set"""
+
+
+class CancelToken:
+    """Flag shared with a running pack_pak/unpack_pak/merge_paks to stop it"""
+    
+    def __init__(self):
+        self._event = threading.Event()
+    
+    def cancel(self):
+        self._event.set()
+    
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class ProgressEvent(collections.namedtuple('ProgressEvent', [
+        'kind', 'operation', 'phase', 'files_done', 'files_total',
+        'bytes_in', 'bytes_out', 'elapsed', 'phase_times', 'message'])):
+    """
+    Snapshot sent to progress callbacks. kind is 'phase' (a new phase
+    began), 'progress' (a file finished), 'message', 'error' or 'done'.
+    """
+    __slots__ = ()
+    
+    @property
+    def ratio(self):
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+
+
+class OperationStats:
+    """
+    Running totals of one pack_pak, unpack_pak or merge_paks call. Every
+    change is reported to the optional progress callback as a ProgressEvent
+    and the object is returned when the operation ends. It is true only if
+    the operation succeeded, so callers can keep testing the result.
+    
+    bytes_in/bytes_out are what was read and written - uncompressed and
+    stored sizes when packing, the other way round when unpacking.
+    phase_times holds the seconds spent in each phase, counters any
+    operation specific numbers (reused files, cache hits...).
+    """
+    
+    def __init__(self, operation, progress=None, cancel_token=None):
+        self.operation = operation
+        self.success = False
+        self.cancelled = False
+        self.phase = None
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.phase_times = {}
+        self.counters = {}
+        self._progress = progress
+        self._cancel_token = cancel_token
+        self._start = self._phase_start = time.perf_counter()
+    
+    def __bool__(self):
+        return self.success
+    
+    @property
+    def ratio(self):
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+    
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._start
+    
+    @property
+    def cancel_token(self):
+        return self._cancel_token
+    
+    def check_cancelled(self):
+        """Raise OperationCancelled if the caller asked to stop"""
+        if self._cancel_token is not None and self._cancel_token.cancelled:
+            raise OperationCancelled()
+    
+    def begin_phase(self, phase):
+        self._end_phase()
+        self.phase = phase
+        self._emit('phase')
+    
+    def file_done(self, bytes_in=0, bytes_out=0):
+        self.files_done += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self._emit('progress')
+    
+    def message(self, text):
+        self._emit('message', text)
+    
+    def error(self, text):
+        self._emit('error', text)
+    
+    def finish(self, success):
+        self._end_phase()
+        self.phase = None
+        self.success = success
+        self._emit('done')
+        return self
+    
+    def _end_phase(self):
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.phase_times[self.phase] = self.phase_times.get(self.phase, 0.0) + now - self._phase_start
+        self._phase_start = now
+    
+    def _emit(self, kind, message=None):
+        if self._progress is not None:
+            self._progress(ProgressEvent(kind, self.operation, self.phase, self.files_done, self.files_total,
+                                         self.bytes_in, self.bytes_out, self.elapsed, dict(self.phase_times),
+                                         message))
+
+
+_PROGRESS_VERBS = {'pack': 'packed', 'unpack': 'extracted', 'merge': 'merged', 'verify': 'verified'}
+
+
+def print_progress(event):
+    """Progress callback that prints to the console, as the command line tool does"""
+    if event.kind == 'message':
+        print(event.message)
+    elif event.kind == 'error':
+        print(f"ERROR: {event.message}")
+    elif event.kind == 'progress':
+        # Only print every 10th file or last file for speed
+        if event.files_done % 10 == 0 or event.files_done == event.files_total:
+            print(f"Progress: {event.files_done}/{event.files_total} files {_PROGRESS_VERBS[event.operation]}")
+    elif event.kind == 'done' and event.phase_times:
+        timings = ', '.join(f"{phase} {seconds:.2f} s" for phase, seconds in event.phase_times.items())
+        print(f"Timings: {timings}\n")
+
+
+# Entries larger than this are decoded and written one chunk at a time
+STREAM_ENTRY_SIZE = 4 * 1024 * 1024
+# Decoded bytes all unpack workers together may hold at once
+UNPACK_MEMORY_BUDGET = 256 * 1024 * 1024
+# Adjacent stored chunks are copied in runs of up to this many bytes
+COPY_RUN_SIZE = 16 * 1024 * 1024
+# Smaller copies go through the file buffer, the kernel copy's extra
+# flush/seek calls would cost more than they save
+KERNEL_COPY_MIN_SIZE = 256 * 1024
+
+
+def _kernel_copy(src_fd, src_offset, out_file, size):
+    """
+    Copy size bytes of src_fd from src_offset to the current position of
+    out_file with os.copy_file_range, or os.sendfile on Linux, so the data
+    never passes through Python. out_file is flushed first and left
+    positioned after the copied bytes. Returns how many bytes were copied:
+    fewer than size (possibly none) where neither call works, in which case
+    the caller copies the rest itself.
+    """
+    try:
+        out_fd = out_file.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return 0
+    out_file.flush()
+    position = out_file.tell()
+    
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                count = os.copy_file_range(src_fd, out_fd, size - copied, src_offset + copied, position + copied)
+                if count == 0:
+                    break
+                copied += count
+        except OSError:
+            # Older kernels refuse some file systems (EXDEV, EINVAL, ENOSYS)
+            pass
+    if copied < size and hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        try:
+            os.lseek(out_fd, position + copied, os.SEEK_SET)
+            while copied < size:
+                count = os.sendfile(out_fd, src_fd, src_offset + copied, size - copied)
+                if count == 0:
+                    break
+                copied += count
+        except OSError:
+            pass
+    
+    if copied:
+        out_file.seek(position + copied)
+    return copied
+
+
+class ByteBudget:
+    """
+    Caps how many bytes a pool of workers holds at once. acquire blocks
+    until the amount fits; a request larger than the whole budget waits
+    until nothing else is held and then runs alone.
+    """
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+    
+    def acquire(self, size):
+        """Block until size bytes fit, returns the amount to release()"""
+        size = min(size, self.limit)
+        with self._condition:
+            while self.in_use and self.in_use + size > self.limit:
+                self._condition.wait()
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+        return size
+    
+    def release(self, size):
+        with self._condition:
+            self.in_use -= size
+            self._condition.notify_all()
+
+
+def _preallocate(out_file, size):
+    """Reserve the full size of an output file before it is written chunk by chunk"""
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(out_file.fileno(), 0, size)
+        else:
+            out_file.truncate(size)
+    except OSError:
+        # Not supported by the file system - the file just grows as it is written
+        pass
+
+
+def decompress_file_worker(args):
+    """Worker function for parallel decompression - reads through a shared PakReader"""
+    file_index, metadata, reader, output_path, max_chunk_size, cancel_token, budget = args
+    
+    file_size = metadata['file_size']
+    # Entries stored without compression are streamed too, as a kernel copy
+    streamed = (file_size > STREAM_ENTRY_SIZE
+                or all(compression_flag == 65535 for _, compression_flag in metadata['chunk_headers']))
+    held = 0
+    try:
+        if budget is not None:
+            held = budget.acquire(2 * max_chunk_size if streamed else file_size)
+        
+        if streamed:
+            try:
+                with open(output_path, 'wb', buffering=max_chunk_size) as out_f:
+                    _preallocate(out_f, file_size)
+                    reader.write_entry(metadata, out_f, cancel_token)
+            except BaseException:
+                # Do not leave a preallocated, partly written file behind
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+                raise
+        else:
+            file_data = reader.read_entry(metadata, cancel_token)
+            
+            # Write file with larger buffer
+            with open(output_path, 'wb', buffering=1024*1024) as out_f:
+                out_f.write(file_data)
+            del file_data
+        
+        # Set creation time
+        set_creation_time(output_path, metadata['creation_date'])
+        
+        return True, metadata['path']
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        return False, f"{metadata['path']}: {str(e)}"
+    finally:
+        if held:
+            budget.release(held)
+
+
+def _close_mapping(mapping, views):
+    """Release the memoryviews over an mmap, then close it"""
+    try:
+        for view in views:
+            view.release()
+        mapping.close()
+    except BufferError:
+        # Slices are still alive somewhere, the mapping is freed with them
+        pass
+
+
+PAK_INDEX_SUFFIX = '.pakidx'
+_PAK_INDEX_MAGIC = b'PAKIDX\x01\x00'
+# magic, pak size, pak mtime (ns), CRC32 of the pak header, entries, chunks, path blob size
+_PAK_INDEX_HEADER = struct.Struct("<8sQQIIII")
+
+
+class PakIndex:
+    """
+    Columnar index of a PAK archive's entries. Every field lives in a flat
+    array instead of one dict per entry: offsets, sizes, name hashes and
+    creation dates, a shared <HH> chunk header table with a start position
+    per entry, and all paths in one UTF-8 blob. Indexing or iterating
+    yields the usual entry dicts, built on demand.
+    
+    The columns are either arrays (parsed from the PAK) or memoryviews
+    over a memory-mapped .pakidx sidecar (see load_pak_index).
+    """
+    
+    max_chunk_size = 65536
+    
+    def __init__(self, file_offsets, file_sizes, name_hashes, creation_dates,
+                 chunk_starts, chunk_headers, path_offsets, path_blob):
+        self.file_offsets = file_offsets
+        self.file_sizes = file_sizes
+        self.name_hashes = name_hashes
+        self.creation_dates = creation_dates
+        self.chunk_starts = chunk_starts  # len + 1 positions into chunk_headers (in chunks)
+        self.chunk_headers = chunk_headers  # size, flag, size, flag, ...
+        self.path_offsets = path_offsets  # len + 1 positions into path_blob
+        self.path_blob = path_blob
+        # Sidecar mapping behind the columns, released by close()
+        self._mapping = None
+        self._views = ()
+    
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Parse a decompressed metadata block in bulk"""
+        view = memoryview(metadata)
+        max_chunk_size = cls.max_chunk_size
+        
+        try:
+            number_of_files = struct.unpack_from("<I", metadata, 1)[0]
+            position = 5
+            
+            # Per file: offset, size, hash, then one <HH> header per chunk
+            file_offsets = array('I')
+            file_sizes = array('I')
+            name_hashes = array('I')
+            header_bytes = bytearray()
+            chunk_starts = array('I', [0])
+            chunk_count = 0
+            unpack_record = struct.Struct("<III").unpack_from
+            for _ in range(number_of_files):
+                file_offset, file_size, name_hash = unpack_record(metadata, position)
+                position += 12
+                file_chunks = (file_size + max_chunk_size - 1) // max_chunk_size
+                file_offsets.append(file_offset)
+                file_sizes.append(file_size)
+                name_hashes.append(name_hash)
+                header_bytes += view[position:position + file_chunks * 4]
+                position += file_chunks * 4
+                chunk_count += file_chunks
+                chunk_starts.append(chunk_count)
+            
+            # Then per file: creation date, path length, path
+            creation_dates = array('Q')
+            path_blob = bytearray()
+            path_offsets = array('I', [0])
+            unpack_tail = struct.Struct("<QB").unpack_from
+            for _ in range(number_of_files):
+                creation_date, path_len = unpack_tail(metadata, position)
+                position += 9
+                creation_dates.append(creation_date)
+                path_blob += view[position:position + path_len]
+                position += path_len
+                path_offsets.append(len(path_blob))
+        except struct.error:
+            raise ValueError('PAK metadata is truncated.')
+        
+        if position > len(metadata) or len(header_bytes) != chunk_count * 4:
+            raise ValueError('PAK metadata is truncated.')
+        
+        chunk_headers = array('H')
+        chunk_headers.frombytes(header_bytes)
+        if sys.byteorder == 'big':
+            chunk_headers.byteswap()
+        
+        return cls(file_offsets, file_sizes, name_hashes, creation_dates,
+                   chunk_starts, chunk_headers, path_offsets, bytes(path_blob))
+    
+    def __len__(self):
+        return len(self.file_offsets)
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('PAK index out of range')
+        return {
+            'index': index,
+            'file_offset': self.file_offsets[index],
+            'file_size': self.file_sizes[index],
+            'file_name_hash': self.name_hashes[index],
+            'chunk_headers': self.entry_chunk_headers(index),
+            'creation_date': self.creation_dates[index],
+            'path': self.path(index),
+        }
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    @classmethod
+    def from_sidecar(cls, mapping, key):
+        """
+        Build an index over a mapped .pakidx sidecar without copying it.
+        Returns None if the sidecar was written for a different version of
+        the PAK (key mismatch) or is damaged.
+        """
+        if len(mapping) < _PAK_INDEX_HEADER.size:
+            return None
+        magic, pak_size, pak_mtime, header_crc, number_of_files, chunk_count, blob_size = \
+            _PAK_INDEX_HEADER.unpack_from(mapping, 0)
+        if magic != _PAK_INDEX_MAGIC or (pak_size, pak_mtime, header_crc) != key:
+            return None
+        
+        # Column layout, widest items first so every column stays aligned
+        layout = (('Q', number_of_files), ('I', number_of_files), ('I', number_of_files),
+                  ('I', number_of_files), ('I', number_of_files + 1), ('I', number_of_files + 1),
+                  ('H', chunk_count * 2), ('B', blob_size))
+        if _PAK_INDEX_HEADER.size + sum(struct.calcsize(code) * count for code, count in layout) != len(mapping):
+            return None
+        
+        view = memoryview(mapping)
+        columns = []
+        position = _PAK_INDEX_HEADER.size
+        for code, count in layout:
+            size = struct.calcsize(code) * count
+            columns.append(view[position:position + size].cast(code))
+            position += size
+        creation_dates, file_offsets, file_sizes, name_hashes, chunk_starts, path_offsets, chunk_headers, path_blob = columns
+        index = cls(file_offsets, file_sizes, name_hashes, creation_dates,
+                    chunk_starts, chunk_headers, path_offsets, path_blob)
+        index._mapping = mapping
+        index._views = columns + [view]
+        return index
+    
+    def close(self):
+        """
+        Unmap the sidecar the columns live in, if any, so it can be replaced
+        (Windows refuses while it is mapped). The index is unusable after.
+        """
+        if self._mapping is None:
+            return
+        _close_mapping(self._mapping, self._views)
+        self._mapping = None
+        self._views = ()
+    
+    def to_sidecar(self, key):
+        """Serialise the index in the .pakidx layout read by from_sidecar"""
+        pak_size, pak_mtime, header_crc = key
+        header = _PAK_INDEX_HEADER.pack(_PAK_INDEX_MAGIC, pak_size, pak_mtime, header_crc,
+                                        len(self), len(self.chunk_headers) // 2, len(self.path_blob))
+        columns = (self.creation_dates, self.file_offsets, self.file_sizes, self.name_hashes,
+                   self.chunk_starts, self.path_offsets, self.chunk_headers)
+        return b''.join([header] + [column.tobytes() for column in columns] + [bytes(self.path_blob)])
+    
+    def path(self, index):
+        return str(self.path_blob[self.path_offsets[index]:self.path_offsets[index + 1]], 'utf-8')
+    
+    def chunk_count(self, index):
+        return self.chunk_starts[index + 1] - self.chunk_starts[index]
+    
+    def entry_chunk_headers(self, index):
+        """List of (chunk_size, compression_flag) header pairs for one entry"""
+        headers = self.chunk_headers
+        return [(headers[n], headers[n + 1])
+                for n in range(self.chunk_starts[index] * 2, self.chunk_starts[index + 1] * 2, 2)]
+    
+    @property
+    def nbytes(self):
+        """Approximate memory held by the index columns"""
+        columns = (self.file_offsets, self.file_sizes, self.name_hashes, self.creation_dates,
+                   self.chunk_starts, self.chunk_headers, self.path_offsets)
+        return sum(len(column) * column.itemsize for column in columns) + len(self.path_blob)
+
+
+def _read_pak_metadata(input_file):
+    """
+    Parse the header and zlib metadata block of a PAK file without touching
+    any file data. Returns a PakIndex whose entries (file_offset, file_size,
+    file_name_hash, chunk_headers, creation_date, path) are in archive order.
+    Raises ValueError if the file is not a version 4 PAK archive or is
+    truncated or corrupt.
+    """
+    with open(input_file, 'rb') as f:
+        try:
+            if f.read(4) != b'PAK!':
+                raise ValueError('Not a PAK file.')
+            
+            version = struct.unpack("<I", f.read(4))[0]
+            if version != 4:
+                raise ValueError(f'PAK file is version {version}, expected version 4.')
+            
+            offset_to_metadata = struct.unpack("<I", f.read(4))[0]
+            
+            f.seek(offset_to_metadata)
+            metadata_size = struct.unpack("<I", f.read(4))[0]
+            f.seek(offset_to_metadata + metadata_size)
+            number_of_chunks = struct.unpack("<I", f.read(4))[0]
+            
+            chunk_headers = io.BytesIO(f.read())
+            f.seek(offset_to_metadata)
+            
+            last_offset = 0
+            last_decompressed_size = 0
+            
+            # Use list for accumulation
+            metadata_parts = []
+            for n in range(number_of_chunks):
+                decompressed_size = struct.unpack("<I", chunk_headers.read(4))[0]
+                second_header_part = chunk_headers.read(4)
+                offset = struct.unpack("<I", second_header_part[:3] + b'\x00')[0]
+                _data_ = f.read(offset - last_offset)
+                if decompressed_size != last_decompressed_size:
+                    try:
+                        metadata_parts.append(zlib.decompress(_data_))
+                    except zlib.error as e:
+                        # The rest of the index would be shifted; nothing after it can be trusted
+                        raise ValueError(f'PAK metadata chunk {n} is corrupt: {e}')
+                last_offset = offset
+                last_decompressed_size = decompressed_size
+        except struct.error:
+            # A short read somewhere in the header, chunk table or metadata
+            raise ValueError('PAK file is truncated.')
+    
+    return PakIndex.from_metadata(b''.join(metadata_parts))
+
+
+def _pak_index_key(input_file):
+    """Size, mtime and header checksum that a .pakidx sidecar must match"""
+    stat = os.stat(input_file)
+    with open(input_file, 'rb') as f:
+        header = f.read(12)
+    return stat.st_size, stat.st_mtime_ns, binascii.crc32(header)
+
+
+def load_pak_index(input_file, use_sidecar=True):
+    """
+    Return the PakIndex of a PAK file, going through a <pak>.pakidx sidecar
+    next to it. A sidecar that matches the PAK's size, mtime and header
+    checksum is memory-mapped as is, so reopening an unchanged PAK skips
+    the zlib metadata entirely. A missing or stale sidecar is rebuilt from
+    the PAK; failing to write it (read-only folder etc.) is not an error.
+    """
+    # The sidecar stores native little-endian columns
+    if not use_sidecar or sys.byteorder != 'little':
+        return _read_pak_metadata(input_file)
+    
+    key = _pak_index_key(input_file)
+    sidecar_path = input_file + PAK_INDEX_SUFFIX
+    
+    try:
+        with open(sidecar_path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        mapping = None
+    
+    if mapping is not None:
+        index = PakIndex.from_sidecar(mapping, key)
+        if index is not None:
+            return index
+        mapping.close()
+    
+    index = _read_pak_metadata(input_file)
+    
+    temp_path = f"{sidecar_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(index.to_sidecar(key))
+        os.replace(temp_path, sidecar_path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    
+    return index
+
+
+def list_pak(input_file):
+    """
+    List the contents of a PAK file from its metadata alone - nothing is
+    decompressed or written to disk. Returns a list of dicts with path,
+    file_size, file_name_hash (CRC32 of the path), creation_date (Windows
+    FILETIME), chunk_count and file_offset for every entry.
+    """
+    index = load_pak_index(input_file)
+    return [
+        {
+            'path': index.path(n),
+            'file_size': index.file_sizes[n],
+            'file_name_hash': index.name_hashes[n],
+            'creation_date': index.creation_dates[n],
+            'chunk_count': index.chunk_count(n),
+            'file_offset': index.file_offsets[n],
+        }
+        for n in range(len(index))
+    ]
+
+
+def _normalize_pak_path(path):
+    """Normalize a PAK entry path for lookups (case and separator insensitive)"""
+    return path.replace('/', '\\').strip('\\').lower()
+
+
+def _compile_path_patterns(patterns):
+    """One regex matching any of the glob patterns against _normalize_pak_path form"""
+    regexes = []
+    for pattern in patterns:
+        pattern = _normalize_pak_path(pattern)
+        # A bare folder name selects everything below it
+        if pattern.endswith('\\') or '*' not in pattern and '?' not in pattern and '[' not in pattern:
+            regexes.append(fnmatch.translate(pattern.rstrip('\\')))
+            pattern = pattern.rstrip('\\') + '\\*'
+        regexes.append(fnmatch.translate(pattern))
+    return re.compile('|'.join(regexes))
+
+
+def select_entries(index, include=None, exclude=None, paths=None):
+    """
+    Indices of the entries of a PakIndex chosen by the filters, in archive
+    order. include and exclude are glob patterns ('graphics/*', '*.xml')
+    matched case-insensitively against the whole path, with / and \\ treated
+    alike and * also matching across folders; a pattern without wildcards
+    names a file or a whole folder. paths lists exact entry paths. An entry
+    is selected if it is in paths or matches include (everything, when
+    neither is given), and does not match exclude. Only the index is looked
+    at - nothing is read from the archive.
+    """
+    if not include and not exclude and paths is None:
+        return list(range(len(index)))
+    
+    include_match = _compile_path_patterns(include).match if include else None
+    exclude_match = _compile_path_patterns(exclude).match if exclude else None
+    wanted = {_normalize_pak_path(path) for path in paths} if paths is not None else None
+    select_all = include_match is None and wanted is None
+    
+    selected = []
+    for n in range(len(index)):
+        path = _normalize_pak_path(index.path(n))
+        if not (select_all or (wanted is not None and path in wanted)
+                or (include_match is not None and include_match(path))):
+            continue
+        if exclude_match is not None and exclude_match(path):
+            continue
+        selected.append(n)
+    return selected
+
+
+class PakEntryStream(io.RawIOBase):
+    """Read-only, seekable stream over one PAK entry, decoding chunks on demand"""
+    
+    def __init__(self, reader, entry):
+        super().__init__()
+        self.reader = reader
+        self.entry = entry
+        self.size = entry['file_size']
+        self._chunk_spans = reader.chunk_spans(entry)
+        self._position = 0
+        self._cached_index = -1
+        self._cached_chunk = b''
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self._position
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+    
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        
+        max_chunk_size = self.reader.max_chunk_size
+        chunk_index = self._position // max_chunk_size
+        if chunk_index != self._cached_index:
+            self._cached_chunk = self.reader.read_chunk(self._chunk_spans[chunk_index])
+            self._cached_index = chunk_index
+        
+        chunk_offset = self._position - chunk_index * max_chunk_size
+        count = min(len(buffer), len(self._cached_chunk) - chunk_offset)
+        if count <= 0:
+            return 0
+        buffer[:count] = self._cached_chunk[chunk_offset:chunk_offset + count]
+        self._position += count
+        return count
+
+
+class PakReader:
+    """Random-access, thread-safe reader for single entries of a PAK archive"""
+    
+    max_chunk_size = 65536
+    
+    def __init__(self, pak_file, use_mmap=True, use_sidecar=True):
+        self.pak_file = pak_file
+        self.index = load_pak_index(pak_file, use_sidecar)
+        self.entries = self.index
+        
+        # Path and hash lookups are built on first use
+        self._by_path = None
+        self._by_hash = None
+        
+        self._file = open(pak_file, 'rb')
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._view = None
+        
+        if use_mmap:
+            try:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+            except (OSError, ValueError, OverflowError):
+                self._mmap = None
+    
+    @property
+    def is_mapped(self):
+        return self._view is not None
+    
+    def close(self):
+        self.index.close()
+        if self._view is not None:
+            _close_mapping(self._mmap, (self._view,))
+            self._view = None
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __iter__(self):
+        return iter(self.entries)
+    
+    def __contains__(self, key):
+        try:
+            self.get_entry(key)
+        except KeyError:
+            return False
+        return True
+    
+    def get_entry(self, key):
+        """Look up an entry by path (str) or CRC32 file_name_hash (int)"""
+        if self._by_path is None:
+            by_path = {}
+            by_hash = {}
+            for n in range(len(self.index)):
+                by_path.setdefault(_normalize_pak_path(self.index.path(n)), n)
+                by_hash.setdefault(self.index.name_hashes[n], n)
+            self._by_path, self._by_hash = by_path, by_hash
+        
+        if isinstance(key, int):
+            return self.index[self._by_hash[key]]
+        return self.index[self._by_path[_normalize_pak_path(key)]]
+    
+    def chunk_spans(self, entry):
+        """List of (offset, stored_size, compression_flag) for an entry's chunks"""
+        spans = []
+        offset = entry['file_offset']
+        for chunk_size, compression_flag in entry['chunk_headers']:
+            size = stored_chunk_size(chunk_size, compression_flag, self.max_chunk_size)
+            spans.append((offset, size, compression_flag))
+            offset += size
+        return spans
+    
+    def prefetch(self, offset, size):
+        """Ask the OS to start reading a region ahead; a no-op where there is no such hint"""
+        if size <= 0 or self._file is None:
+            return
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(self._file.fileno(), offset, size, os.POSIX_FADV_WILLNEED)
+            elif self._mmap is not None and hasattr(mmap, 'MADV_WILLNEED'):
+                start = offset - offset % mmap.PAGESIZE
+                self._mmap.madvise(mmap.MADV_WILLNEED, start, offset + size - start)
+        except (OSError, ValueError):
+            pass
+    
+    def _read_span(self, offset, size):
+        if self._view is not None:
+            return self._view[offset:offset + size]
+        if hasattr(os, 'pread'):
+            return os.pread(self._file.fileno(), size, offset)
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+    
+    def raw_span(self, entry):
+        """The stored (still compressed) bytes of an entry's chunks, in one span"""
+        spans = self.chunk_spans(entry)
+        if not spans:
+            return b''
+        start = spans[0][0]
+        return self._read_span(start, spans[-1][0] + spans[-1][1] - start)
+    
+    def read_chunk(self, span):
+        """Read and decode a single chunk given its (offset, size, flag) span"""
+        offset, size, compression_flag = span
+        return decode_chunk(self._read_span(offset, size), compression_flag, self.max_chunk_size)
+    
+    def read(self, key):
+        """Read and decode one entry, returning its full contents as bytes"""
+        return bytes(self.read_entry(self.get_entry(key)))
+    
+    def read_entry(self, entry, cancel_token=None, scratch=None):
+        """
+        Read and decode an entry dict taken from self.entries. Every chunk is
+        decoded straight into its slice of one preallocated bytearray, which
+        is returned. Given a scratch bytearray of max_chunk_size bytes, each
+        chunk is decoded into it in turn instead, so the entry is only
+        checked and None is returned. A set cancel_token raises
+        OperationCancelled between chunks.
+        """
+        file_size = entry['file_size']
+        file_data = bytearray(file_size) if scratch is None else None
+        spans = self.chunk_spans(entry)
+        if not spans:
+            return file_data
+        
+        # The chunks of an entry are contiguous, so fetch them in one read
+        start = spans[0][0]
+        raw = self.raw_span(entry)
+        
+        position = 0
+        for span in spans:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise OperationCancelled()
+            offset, size, compression_flag = span
+            chunk_data = raw[offset - start:offset - start + size]
+            expected = min(self.max_chunk_size, file_size - position)
+            if scratch is None:
+                position += self._decode_chunk_into(span, chunk_data, file_data, position, expected)
+            else:
+                position += self._decode_chunk_into(span, chunk_data, scratch, 0, expected)
+        return file_data
+    
+    def _decode_chunk_into(self, span, chunk_data, buffer, position, expected):
+        """
+        Decode one chunk into buffer at position and return its size. With
+        buffer None a stored chunk is only checked. Raises RuntimeError
+        unless the chunk decodes to exactly expected bytes.
+        """
+        offset, size, compression_flag = span
+        if compression_flag == 65535:
+            decoded = size if chunk_data is None else len(chunk_data)
+            if decoded == expected and buffer is not None:
+                buffer[position:position + decoded] = chunk_data
+        else:
+            try:
+                decoded = decompress_lzo_into(chunk_data, buffer, position, expected)
+            except Exception as e:
+                raise RuntimeError(f"Chunk at offset {offset} does not decode: {e}") from e
+        if decoded != expected:
+            raise RuntimeError(f"Chunk at offset {offset} decoded to {decoded} bytes, expected {expected}")
+        return decoded
+    
+    def write_entry(self, entry, out_file, cancel_token=None):
+        """
+        Decode an entry straight into out_file (a binary file open for
+        writing), one chunk at a time: only a single decoded chunk is held
+        in memory whatever the entry's size. Runs of adjacent stored chunks
+        are not decoded at all but copied with copy_span. Returns the bytes
+        written.
+        """
+        file_size = entry['file_size']
+        buffer = None
+        
+        position = 0
+        run_offset = run_size = 0
+        for span in self.chunk_spans(entry):
+            if cancel_token is not None and cancel_token.cancelled:
+                raise OperationCancelled()
+            offset, size, compression_flag = span
+            expected = min(self.max_chunk_size, file_size - position)
+            
+            if compression_flag == 65535:
+                self._decode_chunk_into(span, None, None, 0, expected)
+                if run_size and run_offset + run_size == offset and run_size < COPY_RUN_SIZE:
+                    run_size += size
+                else:
+                    if run_size:
+                        self.copy_span(run_offset, run_size, out_file)
+                    run_offset, run_size = offset, size
+                position += size
+                continue
+            
+            if run_size:
+                self.copy_span(run_offset, run_size, out_file)
+                run_size = 0
+            if buffer is None:
+                buffer = bytearray(self.max_chunk_size)
+            decoded = self._decode_chunk_into(span, self._read_span(offset, size), buffer, 0, expected)
+            out_file.write(memoryview(buffer)[:decoded])
+            position += decoded
+        
+        if run_size:
+            self.copy_span(run_offset, run_size, out_file)
+        return position
+    
+    def copy_span(self, offset, size, out_file, cancel_token=None):
+        """
+        Write size bytes of the archive at offset to out_file as they are,
+        in the kernel where the platform allows (see _kernel_copy), from the
+        mapping or plain reads otherwise. The copy goes in pieces of up to
+        COPY_RUN_SIZE, a set cancel_token raises OperationCancelled between
+        them.
+        """
+        done = 0
+        while done < size:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise OperationCancelled()
+            piece = min(size - done, COPY_RUN_SIZE)
+            self._copy_piece(offset + done, piece, out_file)
+            done += piece
+    
+    def _copy_piece(self, offset, size, out_file):
+        copied = 0
+        if size >= KERNEL_COPY_MIN_SIZE:
+            copied = _kernel_copy(self._file.fileno(), offset, out_file, size)
+        while copied < size:
+            piece = min(size - copied, 1024 * 1024)
+            data = self._read_span(offset + copied, piece)
+            if len(data) != piece:
+                raise RuntimeError(f"Chunk data at offset {offset + copied} runs past the end of the archive")
+            out_file.write(data)
+            copied += piece
+    
+    def open(self, key):
+        """Open one entry as a buffered, seekable file-like object"""
+        return io.BufferedReader(PakEntryStream(self, self.get_entry(key)),
+                                 buffer_size=self.max_chunk_size)
+
+
+def unpack_pak(input_file, output_path, use_parallel=True, use_mmap=True, progress=None, cancel_token=None,
+               include=None, exclude=None, paths=None):
+    """
+    Unpack a PAK file with optional parallel processing.
+    include/exclude/paths: restrict the unpack to some entries (see select_entries)
+    progress/cancel_token: ProgressEvent callback and CancelToken; a cancelled unpack removes its files
+    Returns the OperationStats, true if the unpack succeeded.
+    """
+    stats = OperationStats('unpack', progress, cancel_token)
+    stats.message(f"\n=== UNPACKING: {os.path.basename(input_file)} ===\n")
+    
+    stats.begin_phase('index')
+    stats.message("Decompressing metadata...")
+    try:
+        reader = PakReader(input_file, use_mmap=use_mmap)
+    except ValueError as e:
+        stats.error(str(e))
+        return stats.finish(False)
+    
+    try:
+        with reader:
+            selected = select_entries(reader.index, include, exclude, paths)
+            success_count = _unpack_entries(reader, output_path, use_parallel, stats, selected)
+    except OperationCancelled:
+        stats.cancelled = True
+        stats.error("Unpacking cancelled")
+        return stats.finish(False)
+    if success_count is None:
+        return stats.finish(False)
+    
+    stats.message(f"\n✓ Successfully unpacked {success_count}/{len(selected)} files to: {output_path}\n")
+    return stats.finish(True)
+
+
+def _unpack_entries(reader, output_path, use_parallel, stats, selected):
+    """Extract the selected entries of an open PakReader, returns the success count"""
+    metadata_dict = reader.entries
+    
+    if len(metadata_dict) == 0:
+        stats.error('No files in the PAK archive.')
+        return None
+    
+    number_of_files = len(selected)
+    if number_of_files == 0:
+        stats.error('No files in the PAK archive match the filters.')
+        return None
+    
+    stats.files_total = number_of_files
+    if number_of_files == len(metadata_dict):
+        stats.message(f"Found {number_of_files} files\n")
+    else:
+        stats.message(f"Selected {number_of_files} of {len(metadata_dict)} files\n")
+    stats.begin_phase('extract')
+    
+    budget = ByteBudget(UNPACK_MEMORY_BUDGET)
+    batches, folders = plan_extraction(reader, selected, output_path, stats.cancel_token, budget)
+    
+    # Every output folder is created once, up front; the ones that did not
+    # exist yet are removed again if the unpack is cancelled
+    created_folders = []
+    for folder in folders:
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder, exist_ok=True)
+            except OSError:
+                # Reported by the files that cannot be written into it
+                continue
+            created_folders.append(folder)
+    
+    # Output files written so far, removed again if the unpack is cancelled
+    extracted = []
+    
+    def batch_finished(results):
+        for args, success, result in results:
+            if success:
+                metadata = args[1]
+                stored_size = sum(size for _, size, _ in reader.chunk_spans(metadata))
+                stats.file_done(stored_size, metadata['file_size'])
+            else:
+                stats.files_failed += 1
+                stats.error(result)
+    
+    try:
+        _run_batches(batches, lambda batch: extract_batch_worker(batch, extracted), batch_finished,
+                     use_parallel, stats)
+    except OperationCancelled:
+        _remove_extracted(extracted, output_path, created_folders)
+        raise
+    
+    stats.counters['peak_in_flight_bytes'] = budget.peak
+    return stats.files_done
+
+
+def _run_batches(batches, run_batch, batch_finished, use_parallel, stats):
+    """
+    Call run_batch on every batch, on a thread pool unless use_parallel is
+    False or there is only one, and hand each result to batch_finished on
+    this thread. Cancellation is checked between batches.
+    """
+    if use_parallel and len(batches) > 1:
+        # Use ALL CPU cores for maximum speed
+        max_workers = min(multiprocessing.cpu_count(), len(batches))
+        stats.message(f"Using {max_workers} parallel workers\n")
+        
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(run_batch, batch) for batch in batches]
+            for future in as_completed(futures):
+                batch_finished(future.result())
+                stats.check_cancelled()
+        finally:
+            # Drop queued batches; running ones stop at their next chunk
+            executor.shutdown(wait=True, cancel_futures=True)
     else:
-        # Running as script
-        app_dir = os.path.dirname(os.path.abspath(__file__))
+        for batch in batches:
+            stats.check_cancelled()
+            batch_finished(run_batch(batch))
+
+
+# Extraction batches cover up to this many stored bytes or files, so one
+# task streams a region of the archive and small files share a task. A gap
+# wider than EXTRACT_BATCH_GAP (skipped entries) starts a new batch.
+EXTRACT_BATCH_BYTES = 8 * 1024 * 1024
+EXTRACT_BATCH_FILES = 256
+EXTRACT_BATCH_GAP = 1024 * 1024
+
+
+def plan_extraction(reader, selected, output_path, cancel_token=None, budget=None):
+    """
+    Plan the extraction of the selected entries of an open PakReader.
+    Returns (batches, folders). Each batch is (start, end, worker_args):
+    decompress_file_worker argument tuples in file_offset order for one
+    contiguous stretch of the archive, from start to end. folders are the
+    distinct output folders, parents first. cancel_token and the budget
+    (a ByteBudget) are handed to every worker.
+    """
+    entries = reader.entries
+    max_chunk_size = reader.max_chunk_size
+    
+    batches = []
+    folders = set()
+    worker_args = []
+    batch_start = batch_end = 0
+    for n in sorted(selected, key=lambda n: entries.file_offsets[n]):
+        metadata = entries[n]
+        full_output_path = os.path.join(output_path, metadata['path'].lstrip("\\/").replace('\\', os.sep))
+        folders.add(os.path.dirname(full_output_path))
+        
+        spans = reader.chunk_spans(metadata)
+        start = metadata['file_offset']
+        end = spans[-1][0] + spans[-1][1] if spans else start
+        if worker_args and (not batch_end <= start <= batch_end + EXTRACT_BATCH_GAP
+                            or end - batch_start > EXTRACT_BATCH_BYTES
+                            or len(worker_args) >= EXTRACT_BATCH_FILES):
+            batches.append((batch_start, batch_end, worker_args))
+            worker_args = []
+        if not worker_args:
+            batch_start = start
+        batch_end = end
+        worker_args.append((n, metadata, reader, full_output_path, max_chunk_size, cancel_token, budget))
+    if worker_args:
+        batches.append((batch_start, batch_end, worker_args))
+    
+    folders.discard('')
+    return batches, sorted(folders, key=lambda folder: (folder.count(os.sep), folder))
+
+
+def extract_batch_worker(batch, extracted):
+    """
+    Extract one planned batch in archive order, appending each written file
+    to extracted. Returns (args, success, result) for every file.
+    """
+    batch_start, batch_end, worker_args = batch
+    reader = worker_args[0][2]
+    cancel_token = worker_args[0][5]
+    reader.prefetch(batch_start, batch_end - batch_start)
+    
+    results = []
+    for args in worker_args:
+        if cancel_token is not None and cancel_token.cancelled:
+            raise OperationCancelled()
+        success, result = decompress_file_worker(args)
+        if success:
+            extracted.append(args[3])
+        results.append((args, success, result))
+    return results
+
+
+def _remove_extracted(file_paths, output_path, created_folders=()):
+    """Delete files written by a cancelled unpack and any folders left empty"""
+    folders = set(created_folders)
+    for file_path in file_paths:
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        folders.add(os.path.dirname(file_path))
+    
+    root = os.path.abspath(output_path)
+    # Deepest first, so parents are empty by the time they are tried
+    for folder in sorted(folders, key=len, reverse=True):
+        folder = os.path.abspath(folder)
+        while folder != root and folder.startswith(root + os.sep):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+
+# Entries decoded per verify task, so tiny files do not cost a future each
+VERIFY_BATCH_FILES = 64
+
+
+def verify_pak(input_file, use_parallel=True, use_mmap=True, progress=None, cancel_token=None):
+    """
+    Check a PAK file's metadata and decode every chunk without extracting.
+    Problems go to stats.counters['problems'] as (path, description).
+    Returns the OperationStats, true if no problems were found.
+    """
+    stats = OperationStats('verify', progress, cancel_token)
+    stats.message(f"\n=== VERIFYING: {os.path.basename(input_file)} ===\n")
     
-    dll_c_name = 'minilzo_c_x64.dll' if is_64bit else 'minilzo_c_x86.dll'
-    dll_d_name = 'minilzo_d_x64.dll' if is_64bit else 'minilzo_d_x86.dll'
+    stats.begin_phase('index')
+    try:
+        reader = PakReader(input_file, use_mmap=use_mmap, use_sidecar=False)
+        with open(input_file, 'rb') as f:
+            data_end = struct.unpack("<I", f.read(12)[8:12])[0]
+    except (OSError, ValueError) as e:
+        stats.error(str(e))
+        return stats.finish(False)
     
-    dll_c_path = os.path.join(app_dir, dll_c_name)
-    dll_d_path = os.path.join(app_dir, dll_d_name)
+    problems = []
     
-    # Try generic names if specific not found
-    if not os.path.exists(dll_c_path):
-        dll_c_path = os.path.join(app_dir, 'minilzo_c.dll')
-    if not os.path.exists(dll_d_path):
-        dll_d_path = os.path.join(app_dir, 'minilzo_d.dll')
+    def problem(path, description):
+        problems.append((path, description))
+        stats.error(f"{path}: {description}")
     
     try:
-        lzo_compress = CDLL(dll_c_path)
-        lzo_compress.lzo1x_compress_simple.argtypes = [
-            c_char_p, c_size_t, c_char_p, POINTER(c_size_t)
-        ]
-        lzo_compress.lzo1x_compress_simple.restype = c_int
-    except Exception as e:
-        print(f"ERROR: Could not load compression DLL: {dll_c_name}")
-        print(f"Error: {e}")
-        return False
+        with reader:
+            stats.message(f"Found {len(reader.index)} files\n")
+            
+            stats.begin_phase('layout')
+            sound = _verify_layout(reader, data_end, problem)
+            
+            stats.begin_phase('decode')
+            stats.files_total = len(sound)
+            decode_start = time.perf_counter()
+            _verify_chunks(reader, sound, use_parallel, stats, problem)
+            decode_time = time.perf_counter() - decode_start
+    except OperationCancelled:
+        stats.cancelled = True
+        stats.error("Verifying cancelled")
+        return stats.finish(False)
     
-    try:
-        lzo_decompress = CDLL(dll_d_path)
-        lzo_decompress.lzo_decompress.argtypes = [
-            c_char_p, c_size_t, c_char_p, POINTER(c_size_t)
-        ]
-        lzo_decompress.lzo_decompress.restype = c_int
-    except Exception as e:
-        print(f"ERROR: Could not load decompression DLL: {dll_d_name}")
-        print(f"Error: {e}")
-        return False
+    mb_per_second = stats.bytes_out / 1_048_576 / decode_time if decode_time > 0 else 0.0
+    stats.counters['problems'] = problems
+    stats.counters['mb_per_second'] = mb_per_second
+    stats.message(f"\nDecoded {format_size(stats.bytes_out)} from {stats.files_done} files "
+                  f"at {mb_per_second:.1f} MB/s")
     
-    return True
+    if problems:
+        bad_files = len({path for path, _ in problems})
+        stats.message(f"✗ Found {len(problems)} problems in {bad_files} files\n")
+        return stats.finish(False)
+    stats.message("✓ No problems found\n")
+    return stats.finish(True)
 
 
-def compress_lzo(data: bytes) -> bytes:
-    src_len = len(data)
-    dst_len = c_size_t(src_len + src_len // 16 + 64 + 3)
-    dst_buf = create_string_buffer(dst_len.value)
+def _verify_layout(reader, data_end, problem):
+    """
+    Metadata checks that need no file data. Returns the indices of the
+    entries that passed and whose chunks can be decoded.
+    """
+    index = reader.index
+    max_chunk_size = reader.max_chunk_size
+    header_size = 12
+    sound = []
+    extents = []
+    
+    for n in range(len(index)):
+        path_bytes = index.path_blob[index.path_offsets[n]:index.path_offsets[n + 1]]
+        path = str(path_bytes, 'utf-8', 'replace')
+        file_size = index.file_sizes[n]
+        ok = True
+        
+        name_hash = binascii.crc32(path_bytes)
+        if name_hash != index.name_hashes[n]:
+            problem(path, f"name hash {index.name_hashes[n]:08X} is not the CRC32 of the path ({name_hash:08X})")
+        
+        # The parser derives the chunk count from file_size, so the headers
+        # cover the file exactly if every chunk holds its share of it
+        stored_size = 0
+        remaining = file_size
+        for chunk_number, (chunk_size, compression_flag) in enumerate(index.entry_chunk_headers(n)):
+            size = stored_chunk_size(chunk_size, compression_flag, max_chunk_size)
+            expected = min(max_chunk_size, remaining)
+            if compression_flag not in (0, 65535):
+                problem(path, f"chunk {chunk_number} has unknown compression flag {compression_flag}")
+                ok = False
+            elif compression_flag == 65535 and size != expected:
+                problem(path, f"stored chunk {chunk_number} holds {size} bytes, expected {expected}")
+                ok = False
+            stored_size += size
+            remaining -= expected
+        
+        start = index.file_offsets[n]
+        end = start + stored_size
+        if stored_size and (start < header_size or end > data_end):
+            problem(path, f"chunks at {start}-{end} lie outside the data area ({header_size}-{data_end})")
+            ok = False
+        elif stored_size:
+            extents.append((start, end, n))
+        
+        if ok:
+            sound.append(n)
+    
+    # Sweep by offset; an entry starting before the furthest end so far overlaps it
+    extents.sort()
+    furthest_end, furthest = 0, None
+    for start, end, n in extents:
+        if start < furthest_end:
+            problem(index.path(n), f"chunks at {start}-{end} overlap {index.path(furthest)}")
+        if end > furthest_end:
+            furthest_end, furthest = end, n
+    
+    return sound
 
-    result = lzo_compress.lzo1x_compress_simple(
-        c_char_p(data),
-        src_len,
-        dst_buf,
-        byref(dst_len)
-    )
 
-    if result != 0:
-        raise RuntimeError(f"LZO compression failed (code {result})")
+def _verify_entry(reader, entry, scratch, cancel_token):
+    """Decode an entry chunk by chunk into a scratch buffer, returns a problem or None"""
+    buffer = getattr(scratch, 'buffer', None)
+    if buffer is None:
+        buffer = scratch.buffer = bytearray(reader.max_chunk_size)
+    try:
+        reader.read_entry(entry, cancel_token, buffer)
+    except RuntimeError as e:
+        return str(e)
+    return None
 
-    return dst_buf.raw[:dst_len.value]
 
+def _verify_batch(reader, entries, scratch, cancel_token):
+    return [(entry, _verify_entry(reader, entry, scratch, cancel_token)) for entry in entries]
 
-def decompress_lzo(src_data: bytes, expected_size: int) -> bytes:
-    src_len = len(src_data)
-    dst_len = c_size_t(expected_size)
-    dst_buf = create_string_buffer(expected_size)
 
-    result = lzo_decompress.lzo_decompress(
-        c_char_p(src_data),
-        src_len,
-        dst_buf,
-        byref(dst_len)
-    )
-    if result != 0:
-        raise RuntimeError(f"LZO decompression failed (code {result})")
+def _verify_chunks(reader, selected, use_parallel, stats, problem):
+    """Decode the chunks of the selected entries, in parallel unless use_parallel is False"""
+    scratch = threading.local()
+    batches = [[reader.entries[n] for n in selected[i:i + VERIFY_BATCH_FILES]]
+               for i in range(0, len(selected), VERIFY_BATCH_FILES)]
+    
+    def batch_finished(results):
+        for entry, error in results:
+            if error is not None:
+                problem(entry['path'], error)
+            stored_size = sum(size for _, size, _ in reader.chunk_spans(entry))
+            stats.file_done(stored_size, entry['file_size'])
+    
+    _run_batches(batches, lambda batch: _verify_batch(reader, batch, scratch, stats.cancel_token),
+                 batch_finished, use_parallel, stats)
 
-    return dst_buf.raw[:dst_len.value]
 
+def encode_chunk(chunk, use_compression, max_chunk_size=65536):
+    """
+    Encode one chunk for the archive. Returns the <HH> chunk header and the
+    payload - LZO compressed if that made it smaller, stored as-is otherwise.
+    """
+    chunk_size = len(chunk)
+    if use_compression:
+        compressed_chunk = compress_lzo(chunk)
+        compressed_chunk_size = len(compressed_chunk)
+        if compressed_chunk_size < chunk_size:
+            return struct.pack("<HH", compressed_chunk_size, 0), compressed_chunk
+    return struct.pack("<HH", chunk_size_value(max_chunk_size - chunk_size, max_chunk_size), 65535), chunk
 
-def filetime_to_datetime(filetime_int):
-    return datetime.datetime(1601, 1, 1) + datetime.timedelta(microseconds=filetime_int // 10)
 
+# Chunks are probed by compressing a sample this big from their middle; if
+# that does not get below the ratio the chunk is stored without trying
+COMPRESSION_PROBE_SIZE = 4096
+COMPRESSION_PROBE_RATIO = 0.97
 
-def set_creation_time(file_path, filetime_value):
-    if not WINDOWS_AVAILABLE:
-        return
+
+def is_compressible(chunk, sample_size=COMPRESSION_PROBE_SIZE):
+    """
+    Guess whether LZO will shrink a chunk by compressing a small sample of
+    it. Already-compressed data (DXT textures, audio, embedded archives)
+    does not shrink, so it can be stored without a full LZO pass. Chunks
+    too small to be worth probing are always reported as compressible.
+    Only the middle sample is compressed, so this is a heuristic: a chunk
+    that is incompressible there but would shrink elsewhere gets stored.
+    """
+    if len(chunk) <= sample_size * 2:
+        return True
+    start = (len(chunk) - sample_size) // 2
+    sample = chunk[start:start + sample_size]
+    return len(compress_lzo(sample)) < sample_size * COMPRESSION_PROBE_RATIO
+
+
+class ChunkCache:
+    """
+    Persistent, content-addressed cache of encoded chunks, so identical 64K
+    chunks (shared textures, copied shader packs...) are only compressed
+    once across packs and restarts. Keys are a blake2b hash of the raw
+    chunk, values the <HH> chunk header and payload encode_chunk produced.
     
-    try:
-        dt = filetime_to_datetime(filetime_value)
-        wintime = pywintypes.Time(dt)
-        handle = win32file.CreateFile(
-            file_path, win32file.GENERIC_WRITE, 0, None,
-            win32file.OPEN_EXISTING, 0, None
-        )
-        win32file.SetFileTime(handle, wintime, None, wintime)
-        handle.close()
-    except:
-        pass
+    Stored in a single SQLite file capped at max_bytes of payload; when it
+    grows past that the least recently used chunks are evicted. hits,
+    misses and evictions count what happened since the cache was opened.
+    A cache must only be used from one thread at a time.
+    """
+    
+    def __init__(self, cache_file, max_bytes=512*1024*1024):
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        self._db = sqlite3.connect(cache_file, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (key BLOB PRIMARY KEY, header BLOB NOT NULL, "
+                         "payload BLOB NOT NULL, last_used INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_by_last_used ON chunks (last_used)")
+        self.total_bytes, self._clock = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(payload)), 0), COALESCE(MAX(last_used), 0) FROM chunks").fetchone()
+        # Use stamps of hits, written back in one go on commit()
+        self._touched = {}
+        
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+            self._db.commit()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    @staticmethod
+    def key(chunk):
+        return hashlib.blake2b(chunk, digest_size=16).digest()
+    
+    def get(self, key):
+        """The cached (chunk_header, payload) for a key, or None"""
+        row = self._db.execute("SELECT header, payload FROM chunks WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        self._touched[key] = self._clock
+        return row[0], row[1]
+    
+    def put(self, key, chunk_header, payload):
+        self._clock += 1
+        cursor = self._db.execute("INSERT OR IGNORE INTO chunks VALUES (?, ?, ?, ?)",
+                                  (key, bytes(chunk_header), bytes(payload), self._clock))
+        if cursor.rowcount:
+            self.total_bytes += len(payload)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _evict(self):
+        """Drop least recently used chunks until 90% of max_bytes is used"""
+        self._write_touched()
+        target = self.max_bytes * 9 // 10
+        while self.total_bytes > target:
+            rows = self._db.execute("SELECT key, LENGTH(payload) FROM chunks "
+                                    "ORDER BY last_used LIMIT 256").fetchall()
+            if not rows:
+                break
+            self._db.executemany("DELETE FROM chunks WHERE key = ?", [(key,) for key, _ in rows])
+            self.total_bytes -= sum(size for _, size in rows)
+            self.evictions += len(rows)
+    
+    def _write_touched(self):
+        if self._touched:
+            self._db.executemany("UPDATE chunks SET last_used = ? WHERE key = ?",
+                                 [(stamp, key) for key, stamp in self._touched.items()])
+            self._touched.clear()
+    
+    def commit(self):
+        self._write_touched()
+        self._db.commit()
+    
+    def close(self):
+        self.commit()
+        self._db.close()
 
 
-def format_size(size_in_bytes):
-    size_in_bytes = int(size_in_bytes)
-    if size_in_bytes >= 1_048_576:
-        return f"{size_in_bytes / 1_048_576:.2f} MB"
-    else:
-        return f"{size_in_bytes / 1024:.2f} KB"
+PACK_MANIFEST_SUFFIX = '.pakmanifest'
+# Bumped whenever the manifest's hashes change meaning
+PACK_MANIFEST_VERSION = 2
 
 
-def chunk_size_value(size, max_chunk_size):
-    if size == max_chunk_size:
-        size = 0
-    return size
+class _StoredFile(collections.namedtuple('_StoredFile', ['path', 'size'])):
+    """A whole source file queued by pack_pak to be stored without compression"""
+    __slots__ = ()
+    
+    def copy_to(self, out_file, cancel_token=None):
+        """
+        Append the file to out_file, in the kernel where possible, in pieces
+        of up to COPY_RUN_SIZE; a set cancel_token raises OperationCancelled
+        between them. Returns the file's size.
+        """
+        with open(self.path, 'rb') as f:
+            copied = 0
+            while copied < self.size:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise OperationCancelled()
+                piece_end = min(self.size, copied + COPY_RUN_SIZE)
+                if piece_end - copied >= KERNEL_COPY_MIN_SIZE:
+                    copied += _kernel_copy(f.fileno(), copied, out_file, piece_end - copied)
+                    f.seek(copied)
+                while copied < piece_end:
+                    data = f.read(min(piece_end - copied, 1024 * 1024))
+                    if not data:
+                        break
+                    out_file.write(data)
+                    copied += len(data)
+                if copied < piece_end:
+                    break
+        if copied != self.size:
+            raise RuntimeError(f"{self.path} changed size while packing")
+        return copied
 
 
-def pack_offset_and_flag(offset: int, flag: int) -> bytes:
-    offset_bytes = offset.to_bytes(3, byteorder="little")
-    flag_byte = struct.pack("<B", flag)
-    return offset_bytes + flag_byte
+def _stored_chunk_headers(file_size, max_chunk_size=65536):
+    """The <HH> headers encode_chunk gives a file stored without compression"""
+    full_chunks, last_chunk = divmod(file_size, max_chunk_size)
+    headers = struct.pack("<HH", 0, 65535) * full_chunks
+    if last_chunk:
+        headers += struct.pack("<HH", max_chunk_size - last_chunk, 65535)
+    return headers
 
 
-def decompress_file_worker(args):
-    """Worker function for parallel decompression - reads its own file handle"""
-    file_index, metadata, pak_filename, output_path, max_chunk_size = args
-    
+class _PackChunk(collections.namedtuple('_PackChunk', ['chunk_header', 'payload', 'key', 'cache_miss',
+                                                       'probe_seconds_saved'])):
+    """
+    One encoded chunk queued by pack_pak. key is its ChunkCache.key, if it
+    was hashed; cache_miss is set when the chunk cache should store it, and
+    probe_seconds_saved when is_compressible had it stored without LZO.
+    """
+    __slots__ = ()
+
+
+def _encode_pack_chunk(chunk, max_chunk_size=65536, chunk_cache=None, cache_lock=None):
+    """
+    Compression task for one chunk of a packed file. Its key is both the
+    manifest's chunk hash and its chunk_cache key, looked up under cache_lock;
+    on a miss the chunk is probed, then compressed or stored.
+    """
+    key = ChunkCache.key(chunk)
+    if chunk_cache is not None:
+        with cache_lock:
+            cached = chunk_cache.get(key)
+        if cached is not None:
+            return _PackChunk(*cached, key, False, None)
+    probe_start = time.perf_counter()
+    if not is_compressible(chunk):
+        # A full pass costs about len/sample probes, one of which was spent
+        probe_time = time.perf_counter() - probe_start
+        return _PackChunk(*encode_chunk(chunk, False, max_chunk_size), key, False,
+                          probe_time * (len(chunk) / COMPRESSION_PROBE_SIZE - 1))
+    return _PackChunk(*encode_chunk(chunk, True, max_chunk_size), key, chunk_cache is not None, None)
+
+
+def _hash_file(file_path, max_chunk_size=65536):
+    """
+    Content hash used by the pack manifest: a blake2b of the file's chunk
+    keys, so pack_pak can build it from digests its workers computed.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb', buffering=1024*1024) as f:
+        while True:
+            chunk = f.read(max_chunk_size)
+            if not chunk:
+                break
+            hasher.update(ChunkCache.key(chunk))
+    return hasher.hexdigest()
+
+
+def _load_pack_manifest(pak_path, use_compression):
+    """
+    Files recorded by the pack that wrote pak_path, as {path: [size,
+    mtime_ns, hash]}. Empty if there is no manifest, or it belongs to a
+    different version of the PAK or to a pack with other compression.
+    """
     try:
-        # Each worker opens its own file handle for thread safety
-        with open(pak_filename, 'rb', buffering=1024*1024) as f:
-            f.seek(metadata['file_offset'])
-            
-            # Pre-allocate list for chunks
-            file_data_parts = []
-            
-            for header in metadata['chunk_headers']:
-                chunk_size = header[0]
-                compression_flag = header[1]
-                
-                if compression_flag == 65535:
-                    chunk_size = 65536 - chunk_size
-                    chunk_data = f.read(chunk_size)
-                    file_data_parts.append(chunk_data)
-                else:
-                    if chunk_size == 0:
-                        chunk_size = max_chunk_size
-                    chunk_data = f.read(chunk_size)
-                    file_data_parts.append(decompress_lzo(chunk_data, max_chunk_size))
-            
-            # Join all chunks at once
-            file_data = b''.join(file_data_parts)
-        
-        # Create output directory if needed
-        directory_path = os.path.dirname(output_path)
-        if directory_path and not os.path.exists(directory_path):
-            os.makedirs(directory_path, exist_ok=True)
-        
-        # Write file with larger buffer
-        with open(output_path, 'wb', buffering=1024*1024) as out_f:
-            out_f.write(file_data)
-        
-        # Set creation time
-        set_creation_time(output_path, metadata['creation_date'])
-        
-        return True, metadata['path']
-    except Exception as e:
-        return False, f"{metadata['path']}: {str(e)}"
+        with open(pak_path + PACK_MANIFEST_SUFFIX, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != PACK_MANIFEST_VERSION:
+            return {}
+        if manifest.get('pak') != list(_pak_index_key(pak_path)):
+            return {}
+        if manifest.get('use_compression') != use_compression:
+            return {}
+        return manifest.get('files', {})
+    except (OSError, ValueError):
+        return {}
 
 
-def unpack_pak(input_file, output_path, use_parallel=True):
-    """Unpack a PAK file with optional parallel processing"""
-    print(f"\n=== UNPACKING: {os.path.basename(input_file)} ===\n")
-    
-    max_chunk_size = 65536
-    
-    with open(input_file, 'rb') as f:
-        if f.read(4) != b'PAK!':
-            print('ERROR: Not a PAK file.')
-            return False
-        
-        version = struct.unpack("<I", f.read(4))[0]
-        if version != 4:
-            print(f'ERROR: PAK file is version {version}, expected version 4.')
-            return False
-        
-        offset_to_metadata = struct.unpack("<I", f.read(4))[0]
-        
-        f.seek(offset_to_metadata)
-        metadata_size = struct.unpack("<I", f.read(4))[0]
-        f.seek(offset_to_metadata + metadata_size)
-        number_of_chunks = struct.unpack("<I", f.read(4))[0]
-        
-        chunk_headers = io.BytesIO(f.read())
-        f.seek(offset_to_metadata)
-        
-        decompressed_data = b''
-        last_offset = 0
-        last_decompressed_size = 0
-        
-        print("Decompressing metadata...")
-        # Use list for accumulation
-        metadata_parts = []
-        for n in range(number_of_chunks):
-            decompressed_size = struct.unpack("<I", chunk_headers.read(4))[0]
-            second_header_part = chunk_headers.read(4)
-            offset = struct.unpack("<I", second_header_part[:3] + b'\x00')[0]
-            _data_ = f.read(offset - last_offset)
-            if decompressed_size != last_decompressed_size:
+def _write_pack_manifest(pak_path, use_compression, files, stats):
+    try:
+        with open(pak_path + PACK_MANIFEST_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': PACK_MANIFEST_VERSION,
+                'pak': list(_pak_index_key(pak_path)),
+                'use_compression': use_compression,
+                'files': files,
+            }, f)
+    except OSError as e:
+        stats.message(f"WARNING: Could not write pack manifest: {e}")
+
+
+# Folders scanned at once when gathering files for a parallel pack
+SCAN_WORKERS = 8
+
+
+class _PackFile(collections.namedtuple('_PackFile', ['path_in_pak', 'file_path', 'size', 'mtime_ns', 'filetime'])):
+    """One file to pack, with everything pack_pak needs from its single stat"""
+    __slots__ = ()
+
+
+def _scan_folder(folder, prefix):
+    """
+    One os.scandir pass over a folder. Returns its files as (relative path,
+    full path, size, mtime_ns, FILETIME) from one stat each, the files that
+    cannot be stat'ed as (full path, error), and its subfolders as (full
+    path, relative prefix) - symlinked folders are not followed, like
+    os.walk. An unreadable folder gives nothing.
+    """
+    files = []
+    errors = []
+    subfolders = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                relative_path = prefix + entry.name
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subfolders.append((entry.path, relative_path + os.sep))
+                    continue
                 try:
-                    decompressed = zlib.decompress(_data_)
-                    metadata_parts.append(decompressed)
-                except Exception as e:
-                    print(f'WARNING: Decompression failed for chunk {n}: {e}')
-            last_offset = offset
-            last_decompressed_size = decompressed_size
-        
-        decompressed_data = b''.join(metadata_parts)
-        
-        metadata = io.BytesIO(decompressed_data)
-        marker = struct.unpack("<B", metadata.read(1))[0]
-        number_of_files = struct.unpack("<I", metadata.read(4))[0]
-        
-        if number_of_files == 0:
-            print('ERROR: No files in the PAK archive.')
-            return False
-        
-        print(f"Found {number_of_files} files\n")
-        
-        metadata_dict = {}
-        for n in range(number_of_files):
-            metadata_dict[n] = {}
-            metadata_dict[n]['file_offset'] = struct.unpack("<I", metadata.read(4))[0]
-            file_size = struct.unpack("<I", metadata.read(4))[0]
-            metadata_dict[n]['file_size'] = file_size
-            metadata_dict[n]['file_name_hash'] = struct.unpack("<I", metadata.read(4))[0]
-            
-            file_chunks = file_size // max_chunk_size
-            last_chunk = file_size % max_chunk_size
-            if last_chunk != 0:
-                file_chunks += 1
-            
-            metadata_dict[n]['chunk_headers'] = []
-            for _ in range(file_chunks):
-                metadata_dict[n]['chunk_headers'].append(struct.unpack("<HH", metadata.read(4)))
-        
-        for n in range(number_of_files):
-            creation_date = struct.unpack("<Q", metadata.read(8))[0]
-            path_len = struct.unpack("<B", metadata.read(1))[0]
-            path = metadata.read(path_len).decode('utf-8')
-            
-            metadata_dict[n]['creation_date'] = creation_date
-            metadata_dict[n]['path'] = path
-    
-    # Prepare worker arguments
-    worker_args = []
-    for n in range(number_of_files):
-        full_output_path = os.path.join(output_path, metadata_dict[n]['path'].lstrip("\\/"))
-        worker_args.append((n, metadata_dict[n], input_file, full_output_path, max_chunk_size))
+                    stat = entry.stat()
+                except OSError as e:
+                    errors.append((entry.path, e))
+                    continue
+                # Windows FILETIME
+                filetime = int((stat.st_ctime + 11644473600) * 10**7)
+                files.append((relative_path, entry.path, stat.st_size, stat.st_mtime_ns, filetime))
+    except OSError:
+        pass
+    return files, errors, subfolders
+
+
+def _gather_pack_files(input_folders, max_workers=1):
+    """
+    Build the list of files to pack from one or more folders overlaid in
+    priority order, highest first: a path (compared as the game does,
+    ignoring case and slash direction) found in several folders is taken
+    from the first. Every folder is listed once with os.scandir and every
+    file stat'ed once; with max_workers above 1 the folders are scanned on
+    a thread pool, which pays off for huge trees and network shares.
     
-    # Use parallel processing for decompression
-    if use_parallel and number_of_files > 4:
-        # Use ALL CPU cores for maximum speed
-        max_workers = min(multiprocessing.cpu_count(), number_of_files)
-        print(f"Using {max_workers} parallel workers\n")
-        
-        success_count = 0
-        # Suppress individual file output for speed, just show count
+    Returns (files, errors): files is a list of _PackFile sorted by path,
+    errors lists (full path, error) for files that could not be stat'ed.
+    """
+    found = [[] for _ in input_folders]
+    errors = []
+    if max_workers > 1:
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(decompress_file_worker, args) for args in worker_args]
-            
-            for future in as_completed(futures):
-                success, result = future.result()
-                if success:
-                    success_count += 1
-                    # Only print every 10th file or last file for speed
-                    if success_count % 10 == 0 or success_count == number_of_files:
-                        print(f"Progress: {success_count}/{number_of_files} files extracted")
-                else:
-                    print(f"ERROR: {result}")
+            scans = {executor.submit(_scan_folder, folder, ''): priority
+                     for priority, folder in enumerate(input_folders)}
+            while scans:
+                done, _ = wait(scans, return_when=FIRST_COMPLETED)
+                for future in done:
+                    priority = scans.pop(future)
+                    files, folder_errors, subfolders = future.result()
+                    found[priority].extend(files)
+                    errors.extend(folder_errors)
+                    for subfolder in subfolders:
+                        scans[executor.submit(_scan_folder, *subfolder)] = priority
     else:
-        # Sequential processing
-        success_count = 0
-        for args in worker_args:
-            success, result = decompress_file_worker(args)
-            if success:
-                success_count += 1
-                print(f"[{success_count}/{number_of_files}] {result} ({format_size(args[1]['file_size'])})")
-            else:
-                print(f"ERROR: {result}")
+        for priority, input_folder in enumerate(input_folders):
+            stack = [(input_folder, '')]
+            while stack:
+                files, folder_errors, subfolders = _scan_folder(*stack.pop())
+                found[priority].extend(files)
+                errors.extend(folder_errors)
+                stack.extend(subfolders)
     
-    print(f"\n✓ Successfully unpacked {success_count}/{number_of_files} files to: {output_path}\n")
-    return True
+    owners = {}
+    winners = []
+    for priority, files in enumerate(found):
+        for file in files:
+            if owners.setdefault(_normalize_pak_path(file[0]), priority) == priority:
+                winners.append(file)
+    # Sorted by the OS path, as os.walk + sort did, so the archive order is unchanged
+    winners.sort(key=lambda file: file[0])
+    
+    # PAK paths always use backslashes, whatever OS packs them
+    files = [_PackFile(relative_path.replace(os.sep, '\\'), file_path, size, mtime_ns, filetime)
+             for relative_path, file_path, size, mtime_ns, filetime in winners]
+    errors.sort(key=lambda error: error[0])
+    return files, errors
 
 
-def pack_pak(input_folder, output_file, use_compression=True, use_parallel=False):
+def pack_pak(input_folder, output_file, use_compression=True, use_parallel=True, previous_pak=None,
+             chunk_cache=None, progress=None, cancel_token=None):
     """
-    Pack a folder into a PAK file - Fixed to match original pack.py logic
-    Note: Parallel processing disabled for packing to maintain correct file order and chunking
+    Pack a folder into a PAK file, compressing chunks on a thread pool.
+    input_folder: a folder, or a list of folders overlaid highest priority first
+    previous_pak: earlier pack whose manifest lets unchanged files be reused
+    chunk_cache: optional ChunkCache of already compressed chunks
+    progress/cancel_token: ProgressEvent callback and CancelToken
+    Returns the OperationStats, true if the pack succeeded.
     """
-    print(f"\n=== PACKING: {os.path.basename(input_folder)} ===\n")
+    stats = OperationStats('pack', progress, cancel_token)
+    input_folders = [input_folder] if isinstance(input_folder, (str, os.PathLike)) else list(input_folder)
+    stats.message(f"\n=== PACKING: {', '.join(os.path.basename(folder) for folder in input_folders)} ===\n")
+    
+    if use_compression and not can_compress_lzo():
+        stats.message("NOTE: No LZO compressor available, chunks will be stored uncompressed\n")
+        use_compression = False
+    
+    # The cache may outlive this call; only count its hits and misses from here
+    if chunk_cache is not None:
+        cache_hits_before, cache_misses_before = chunk_cache.hits, chunk_cache.misses
+    # Compression tasks look chunks up in the cache and the writer stores them, one at a time
+    cache_lock = threading.Lock()
+    
+    previous_reader = None
+    previous_files = {}
+    manifest_files = {}
+    reused_count = 0
+    write_path = output_file
+    if previous_pak and os.path.isfile(previous_pak):
+        previous_files = _load_pack_manifest(previous_pak, use_compression)
+        if previous_files:
+            try:
+                previous_reader = PakReader(previous_pak)
+            except (OSError, ValueError) as e:
+                stats.message(f"NOTE: Cannot reuse {os.path.basename(previous_pak)}, packing everything: {e}\n")
+                previous_files = {}
+        if previous_reader and os.path.abspath(previous_pak) == os.path.abspath(output_file):
+            # Chunks are copied out of the old file, so write next to it
+            write_path = output_file + '.tmp'
     
     file_extensions_uncompressed = ('.vso', '.pso', '.rs', '.bik')
     max_chunk_size = 65536
@@ -344,158 +2288,438 @@ def pack_pak(input_folder, output_file, use_compression=True, use_parallel=False
     meta_part_2 = bytearray()
     file_count = 0
     
-    file_chunks_storage = io.BytesIO()
-    chunks_counter = 0
+    # Path in pak -> [chunks stored without compressing, estimated seconds saved]
+    probe_savings = {}
     
     header = b'PAK!' + struct.pack('<I', 4)
     # Larger write buffer for speed
-    pak_file = open(output_file, 'wb', buffering=2*1024*1024)
+    pak_file = open(write_path, 'wb', buffering=2*1024*1024)
     pak_file.write(header)
     pak_file.write(struct.pack("<I", 0))  # Placeholder for metadata offset
     offset_to_metadata = len(header) + 4
     
-    # Gather all files first
-    all_files = []
-    for root, dirs, files in os.walk(input_folder):
-        for file in files:
-            all_files.append(os.path.join(root, file))
+    # Gather all files first, sorted to ensure consistent order
+    stats.begin_phase('scan')
+    all_files, scan_errors = _gather_pack_files(input_folders, SCAN_WORKERS if use_parallel else 1)
+    for file_path, e in scan_errors:
+        stats.files_failed += 1
+        stats.error(f"processing {file_path}: {e}")
     
     if not all_files:
-        print("ERROR: No files found to pack.")
-        pak_file.close()
-        return False
+        stats.error("No files found to pack.")
+        _finish_pack(pak_file, previous_reader, write_path, output_file, False)
+        return stats.finish(False)
     
-    # Sort to ensure consistent order
-    all_files.sort()
+    stats.files_total = len(all_files)
+    stats.message(f"Found {len(all_files)} files to pack\n")
     
-    print(f"Found {len(all_files)} files to pack\n")
+    executor = None
+    max_in_flight = 1
+    if use_parallel and use_compression:
+        max_workers = multiprocessing.cpu_count()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Bound the chunks held in memory while keeping every worker busy
+        max_in_flight = max_workers * 4
+        stats.message(f"Using {max_workers} compression workers\n")
     
-    # Process each file
-    for file_idx, file_path in enumerate(all_files):
-        try:
-            file_size = os.path.getsize(file_path)
-            
-            # Windows FILETIME
-            filetime = int((os.path.getctime(file_path) + 11644473600) * 10**7)
-            
-            file_path_in_pak = os.path.relpath(file_path, input_folder)
-            
-            pack_file_uncompressed = file_path_in_pak.lower().endswith(file_extensions_uncompressed)
-            
-            file_path_in_pak_bytes = file_path_in_pak.encode()
-            crc32_hash = binascii.crc32(file_path_in_pak_bytes)
+    # Encoded chunks waiting to be written, in archive order
+    pending = collections.deque()
+    # Path in pak of the file being written, its manifest entry and the hash of its chunk keys
+    writing_path = None
+    hashed_entry = None
+    file_hasher = None
+    
+    def finish_file_hash():
+        nonlocal hashed_entry
+        if hashed_entry is not None:
+            hashed_entry[2] = file_hasher.hexdigest()
+            hashed_entry = None
+    
+    def write_next_chunk():
+        nonlocal offset_to_metadata, file_count, writing_path, hashed_entry, file_hasher
+        file_record, encoded = pending.popleft()
+        if isinstance(encoded, Future):
+            encoded = encoded.result()
+        chunk_header, payload, chunk_key, cache_miss, probe_seconds_saved = encoded
+        if cache_miss:
+            with cache_lock:
+                chunk_cache.put(chunk_key, chunk_header, payload)
+        
+        if file_record is not None:
+            # First chunk of a file - write its metadata
+            file_path_in_pak, file_size, filetime, file_path_in_pak_bytes, crc32_hash, manifest_entry = file_record
+            finish_file_hash()
+            writing_path = file_path_in_pak
+            if manifest_entry is not None:
+                manifest_files[file_path_in_pak] = manifest_entry
+                if manifest_entry[2] is None:
+                    hashed_entry = manifest_entry
+                    file_hasher = hashlib.blake2b(digest_size=16)
+            meta_part_1.extend(struct.pack("<I", offset_to_metadata))
+            meta_part_1.extend(struct.pack("<I", file_size))
+            meta_part_1.extend(struct.pack("<I", crc32_hash))
             
-            first_chunk = True
+            meta_part_2.extend(struct.pack('<Q', filetime))
+            meta_part_2.extend(struct.pack("<B", len(file_path_in_pak_bytes)))
+            meta_part_2.extend(file_path_in_pak_bytes)
+            file_count += 1
+        
+        if chunk_key is not None:
+            file_hasher.update(chunk_key)
+        if probe_seconds_saved is not None:
+            file_savings = probe_savings.setdefault(writing_path, [0, 0.0])
+            file_savings[0] += 1
+            file_savings[1] += probe_seconds_saved
+        
+        meta_part_1.extend(chunk_header)
+        if isinstance(payload, _StoredFile):
+            payload_size = payload.copy_to(pak_file, stats.cancel_token)
+        else:
+            pak_file.write(payload)
+            payload_size = len(payload)
+        offset_to_metadata += payload_size
+        stats.bytes_out += payload_size
+    
+    stats.begin_phase('compress')
+    try:
+        # Process each file
+        for file_path_in_pak, file_path, file_size, mtime_ns, filetime in all_files:
+            stats.check_cancelled()
+            try:
+                pack_file_uncompressed = file_path_in_pak.lower().endswith(file_extensions_uncompressed)
+                compress_file = use_compression and not pack_file_uncompressed
+                
+                file_path_in_pak_bytes = file_path_in_pak.encode()
+                if len(file_path_in_pak_bytes) > 255:
+                    raise ValueError("path is longer than 255 bytes")
+                crc32_hash = binascii.crc32(file_path_in_pak_bytes)
+                
+                # Compressed files get their manifest hash filled in as they are written
+                manifest_entry = [file_size, mtime_ns, None] if compress_file else None
+                
+                # Unchanged since the previous pack - reuse its compressed chunks.
+                # Files stored as is gain nothing from that and are not hashed
+                reused_entry = None
+                stored_file = None
+                previous = previous_files.get(file_path_in_pak)
+                if (compress_file and previous is not None and file_size > 0
+                        and previous[:2] == [file_size, mtime_ns]
+                        and file_path_in_pak in previous_reader
+                        and _hash_file(file_path) == previous[2]):
+                    reused_entry = previous_reader.get_entry(file_path_in_pak)
+                    manifest_entry = previous
+                elif not compress_file and file_size > 0:
+                    # Stored as is - copied in the kernel when written, never read here
+                    stored_file = _StoredFile(file_path, file_size)
+                else:
+                    # Larger read buffer
+                    f = open(file_path, 'rb', buffering=1024*1024)
+            except (OSError, ValueError) as e:
+                stats.files_failed += 1
+                stats.error(f"processing {file_path}: {e}")
+                continue
             
-            # Larger read buffer
-            with open(file_path, 'rb', buffering=1024*1024) as f:
-                while True:
-                    chunk = f.read(max_chunk_size)
-                    if not chunk:
-                        break
-                    
-                    chunk_size = len(chunk)
-                    
-                    if first_chunk:
-                        # Write metadata for this file (using extend on bytearray is fast)
-                        meta_part_1.extend(struct.pack("<I", offset_to_metadata))
-                        meta_part_1.extend(struct.pack("<I", file_size))
-                        meta_part_1.extend(struct.pack("<I", crc32_hash))
+            file_record = (file_path_in_pak, file_size, filetime, file_path_in_pak_bytes, crc32_hash, manifest_entry)
+            if reused_entry is not None:
+                chunk_headers = b''.join(struct.pack("<HH", *chunk_header)
+                                         for chunk_header in reused_entry['chunk_headers'])
+                pending.append((file_record, _PackChunk(chunk_headers, previous_reader.raw_span(reused_entry),
+                                                        None, False, None)))
+                reused_count += 1
+                
+                while len(pending) >= max_in_flight:
+                    write_next_chunk()
+            elif stored_file is not None:
+                pending.append((file_record, _PackChunk(_stored_chunk_headers(file_size, max_chunk_size),
+                                                        stored_file, None, False, None)))
+                
+                while len(pending) >= max_in_flight:
+                    write_next_chunk()
+            else:
+                # Once a file's chunks are queued it can no longer be skipped, so
+                # read and compression errors from here on abort the whole pack
+                with f:
+                    while True:
+                        stats.check_cancelled()
+                        chunk = f.read(max_chunk_size)
+                        if not chunk:
+                            break
+                        if executor:
+                            encoded = executor.submit(_encode_pack_chunk, chunk, max_chunk_size,
+                                                      chunk_cache, cache_lock)
+                        else:
+                            encoded = _encode_pack_chunk(chunk, max_chunk_size, chunk_cache, cache_lock)
                         
-                        meta_part_2.extend(struct.pack('<Q', filetime))
-                        meta_part_2.extend(struct.pack("<B", len(file_path_in_pak_bytes)))
-                        meta_part_2.extend(file_path_in_pak_bytes)
+                        pending.append((file_record, encoded))
+                        file_record = None
                         
-                        first_chunk = False
-                        file_count += 1
-                    
-                    # Compress and write chunk
-                    if use_compression and not pack_file_uncompressed:
-                        compressed_chunk = compress_lzo(chunk)
-                        compressed_chunk_size = len(compressed_chunk)
-                        if compressed_chunk_size < chunk_size:
-                            # Use compressed version
-                            meta_part_1.extend(struct.pack("<HH", compressed_chunk_size, 0))
-                            file_chunks_storage.write(compressed_chunk)
-                            chunks_counter += 1
-                            offset_to_metadata += compressed_chunk_size
-                        else:
-                            # Compressed is bigger, use uncompressed
-                            if chunk_size <= max_chunk_size:
-                                meta_part_1.extend(struct.pack("<HH", chunk_size_value(max_chunk_size - chunk_size, max_chunk_size), 65535))
-                            file_chunks_storage.write(chunk)
-                            chunks_counter += 1
-                            offset_to_metadata += chunk_size
-                    else:
-                        # Don't compress
-                        meta_part_1.extend(struct.pack("<HH", chunk_size_value(max_chunk_size - chunk_size, max_chunk_size), 65535))
-                        file_chunks_storage.write(chunk)
-                        chunks_counter += 1
-                        offset_to_metadata += chunk_size
-                    
-                    # Write chunks in batches to avoid memory issues
-                    if chunks_counter >= 2000:
-                        chunks_counter = 0
-                        pak_file.write(file_chunks_storage.getvalue())
-                        pak_file.flush()
-                        file_chunks_storage = io.BytesIO()
+                        while len(pending) >= max_in_flight:
+                            write_next_chunk()
             
-            # Only print every 10th file for speed
-            if (file_idx + 1) % 10 == 0 or (file_idx + 1) == len(all_files):
-                print(f"Progress: {file_idx + 1}/{len(all_files)} files packed")
-            
-        except Exception as e:
-            print(f"ERROR processing {file_path}: {e}")
-            continue
-    
-    # Write remaining chunks
-    if len(file_chunks_storage.getvalue()) > 0:
-        pak_file.write(file_chunks_storage.getvalue())
-        pak_file.flush()
-    file_chunks_storage.close()
+            stats.file_done(file_size)
+        
+        # Write remaining chunks
+        while pending:
+            write_next_chunk()
+        finish_file_hash()
+    except Exception as e:
+        if isinstance(e, OperationCancelled):
+            stats.cancelled = True
+            stats.error("Packing cancelled")
+        else:
+            stats.error(f"Packing failed: {e}")
+        pending.clear()
+        _finish_pack(pak_file, previous_reader, write_path, output_file, False)
+        return stats.finish(False)
+    finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+    pak_file.flush()
     
     if file_count > 0:
-        print("\nCompressing metadata...")
-        # Compress and write metadata
-        uncompressed_metadata = struct.pack("<B", 1)
-        uncompressed_metadata += struct.pack("<I", file_count) + bytes(meta_part_1) + bytes(meta_part_2)
-        
-        stream = BytesIO(uncompressed_metadata)
-        decompressed_size = 0
-        chunk_headers = struct.pack("<I", 0) + pack_offset_and_flag(4, 128)
-        chunk_end_offset = 4
-        chunk_headers_count = 1
-        
-        # Compress metadata in chunks
-        compressed_parts = []
-        while True:
-            chunk = stream.read(max_chunk_size)
-            if not chunk:
-                break
-            decompressed_size += len(chunk)
-            compressed_chunk = zlib.compress(chunk, level=1)  # Fastest compression for metadata
-            compressed_parts.append(compressed_chunk)
+        stats.begin_phase('metadata')
+        stats.message("\nCompressing metadata...")
+        write_pak_metadata(pak_file, file_count, meta_part_1, meta_part_2, offset_to_metadata)
+        _finish_pack(pak_file, previous_reader, write_path, output_file, True)
+        
+        if probe_savings:
+            skipped_chunks = sum(chunks for chunks, _ in probe_savings.values())
+            saved_time = sum(seconds for _, seconds in probe_savings.values())
+            stats.counters['probe_stored_chunks'] = skipped_chunks
+            stats.counters['probe_seconds_saved'] = saved_time
+            stats.counters['probe_savings_by_file'] = probe_savings
+            stats.message(f"Stored {skipped_chunks} incompressible chunks from {len(probe_savings)} files "
+                          f"without compressing, ~{saved_time * 1000:.0f} ms of LZO time saved")
+            for path, (chunks, seconds) in sorted(probe_savings.items(), key=lambda item: -item[1][1])[:5]:
+                stats.message(f"  {path}: {chunks} chunks, ~{seconds * 1000:.1f} ms")
+        if chunk_cache is not None:
+            chunk_cache.commit()
+            stats.counters['cache_hits'] = chunk_cache.hits - cache_hits_before
+            stats.counters['cache_misses'] = chunk_cache.misses - cache_misses_before
+            stats.message(f"Chunk cache: {stats.counters['cache_hits']} hits, "
+                          f"{stats.counters['cache_misses']} misses, "
+                          f"{chunk_cache.evictions} evicted ({format_size(chunk_cache.total_bytes)} cached)")
+        # Always written, so the next pack over this one is incremental
+        _write_pack_manifest(output_file, use_compression, manifest_files, stats)
+        if previous_pak:
+            stats.counters['reused_files'] = reused_count
+            stats.message(f"Reused {reused_count} unchanged files from {os.path.basename(previous_pak)}, "
+                          f"packed {file_count - reused_count}")
+        
+        stats.message(f"\n✓ Successfully packed to: {output_file}\n")
+        return stats.finish(True)
+    else:
+        _finish_pack(pak_file, previous_reader, write_path, output_file, False)
+        stats.error('No files to pack.')
+        return stats.finish(False)
+
+
+def _finish_pack(pak_file, previous_reader, write_path, output_file, success):
+    """
+    Close the output and previous PAK. A temporary output is moved into
+    place on success; on failure the partial output is removed.
+    """
+    pak_file.close()
+    if previous_reader:
+        previous_reader.close()
+    if not success:
+        try:
+            os.remove(write_path)
+        except OSError:
+            pass
+    elif write_path != output_file:
+        os.replace(write_path, output_file)
+
+
+def _metadata_chunks(parts, chunk_size):
+    """
+    Split the concatenation of parts into chunk_size pieces without joining
+    them: pieces inside one part are memoryview slices, only the pieces
+    straddling two parts are copied.
+    """
+    carry = bytearray()
+    for part in parts:
+        view = memoryview(part)
+        position = 0
+        if carry:
+            position = chunk_size - len(carry)
+            carry += view[:position]
+            if len(carry) < chunk_size:
+                continue
+            yield bytes(carry)
+            carry = bytearray()
+        while len(view) - position >= chunk_size:
+            yield view[position:position + chunk_size]
+            position += chunk_size
+        carry += view[position:]
+    if carry:
+        yield bytes(carry)
+
+
+def _compress_metadata_chunk(chunk):
+    return len(chunk), zlib.compress(chunk, level=1)  # Fastest compression for metadata
+
+
+def write_pak_metadata(pak_file, file_count, meta_part_1, meta_part_2, offset_to_metadata):
+    """
+    Compress and append the metadata block, then patch the metadata offset
+    in the header. meta_part_1 holds the per-file offset/size/hash/chunk
+    header records, meta_part_2 the creation dates and paths.
+    
+    The metadata is never joined into one buffer: it is cut into 64 KB
+    pieces straight from the two parts, the pieces are zlib compressed on a
+    thread pool (zlib releases the GIL) and written to pak_file in order as
+    they complete, so finishing takes time linear in the metadata size.
+    """
+    max_chunk_size = 65536
+    
+    parts = (struct.pack("<BI", 1, file_count), meta_part_1, meta_part_2)
+    chunk_total = -(-sum(len(part) for part in parts) // max_chunk_size)
+    
+    # Size of the compressed block, patched once all chunks are written
+    block_start = pak_file.tell()
+    pak_file.write(struct.pack("<I", 0))
+    
+    decompressed_size = 0
+    chunk_end_offset = 4
+    chunk_headers = [struct.pack("<I", 0) + pack_offset_and_flag(4, 128)]
+    
+    chunks = _metadata_chunks(parts, max_chunk_size)
+    workers = min(multiprocessing.cpu_count(), chunk_total)
+    if workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        compressed_chunks = executor.map(_compress_metadata_chunk, chunks)
+    else:
+        executor = None
+        compressed_chunks = map(_compress_metadata_chunk, chunks)
+    
+    try:
+        for chunk_length, compressed_chunk in compressed_chunks:
+            pak_file.write(compressed_chunk)
+            decompressed_size += chunk_length
             chunk_end_offset += len(compressed_chunk)
-            chunk_headers += struct.pack("<I", decompressed_size) + pack_offset_and_flag(chunk_end_offset, 128)
-            chunk_headers_count += 1
+            chunk_headers.append(struct.pack("<I", decompressed_size) + pack_offset_and_flag(chunk_end_offset, 128))
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+    
+    pak_file.write(struct.pack("<I", len(chunk_headers)))
+    pak_file.write(b''.join(chunk_headers))
+    metadata_end = pak_file.tell()
+    
+    pak_file.seek(block_start)
+    pak_file.write(struct.pack("<I", chunk_end_offset))
+    
+    # Update metadata offset
+    pak_file.seek(8)
+    pak_file.write(struct.pack("<I", offset_to_metadata))
+    pak_file.seek(metadata_end)
+    pak_file.flush()
+
+
+def merge_paks(pak_files, output_file, progress=None, cancel_token=None):
+    """
+    Merge PAK files into one by copying compressed chunks, no recompression.
+    pak_files: load order, highest priority first; the first archive with a path wins
+    progress/cancel_token: as for pack_pak; the output is only replaced once complete
+    Returns the OperationStats, true if the merge succeeded.
+    """
+    stats = OperationStats('merge', progress, cancel_token)
+    stats.message(f"\n=== MERGING: {len(pak_files)} PAK files ===\n")
+    
+    output_abspath = os.path.normcase(os.path.abspath(output_file))
+    if any(os.path.normcase(os.path.abspath(pak)) == output_abspath for pak in pak_files):
+        stats.error(f"Output file is also one of the inputs: {output_file}")
+        return stats.finish(False)
+    
+    stats.begin_phase('index')
+    readers = []
+    write_path = None
+    try:
+        for pak in pak_files:
+            try:
+                readers.append(PakReader(pak))
+            except ValueError as e:
+                stats.error(f"{os.path.basename(pak)}: {e}")
+                return stats.finish(False)
+            stats.message(f"{os.path.basename(pak)}: {len(readers[-1])} files")
         
-        compressed_metadata = b''.join(compressed_parts)
-        complete_meta_part = struct.pack("<I", len(compressed_metadata) + 4) + compressed_metadata + struct.pack("<I", chunk_headers_count) + chunk_headers
+        # Resolve the winning entry for every path by priority
+        winners = {}
+        for reader in readers:
+            for entry in reader.entries:
+                winners.setdefault(_normalize_pak_path(entry['path']), (reader, entry))
         
-        pak_file.write(complete_meta_part)
+        if not winners:
+            stats.error('No files to merge.')
+            return stats.finish(False)
         
-        # Update metadata offset
-        pak_file.seek(8)
-        pak_file.write(struct.pack("<I", offset_to_metadata))
-        pak_file.flush()
-        pak_file.close()
+        # Same ordering as pack_pak, which sorts by path
+        merged = sorted(winners.values(), key=lambda winner: winner[1]['path'])
+        stats.files_total = len(merged)
+        stats.message(f"\nMerging {len(merged)} unique files\n")
+        stats.begin_phase('copy')
         
-        print(f"\n✓ Successfully packed to: {output_file}\n")
-        return True
-    else:
-        pak_file.close()
-        print('ERROR: No files to pack.')
-        return False
+        meta_part_1 = bytearray()
+        meta_part_2 = bytearray()
+        
+        header = b'PAK!' + struct.pack('<I', 4)
+        write_path = output_file + '.tmp'
+        with open(write_path, 'wb', buffering=2*1024*1024) as pak_file:
+            pak_file.write(header)
+            pak_file.write(struct.pack("<I", 0))  # Placeholder for metadata offset
+            offset_to_metadata = len(header) + 4
+            
+            # Entries that follow each other in the same source are copied in one run
+            run_reader, run_offset, run_size = None, 0, 0
+            for reader, entry in merged:
+                stats.check_cancelled()
+                file_path_in_pak_bytes = entry['path'].encode('utf-8')
+                
+                meta_part_1.extend(struct.pack("<I", offset_to_metadata))
+                meta_part_1.extend(struct.pack("<I", entry['file_size']))
+                meta_part_1.extend(struct.pack("<I", entry['file_name_hash']))
+                for chunk_size, compression_flag in entry['chunk_headers']:
+                    meta_part_1.extend(struct.pack("<HH", chunk_size, compression_flag))
+                
+                meta_part_2.extend(struct.pack('<Q', entry['creation_date']))
+                meta_part_2.extend(struct.pack("<B", len(file_path_in_pak_bytes)))
+                meta_part_2.extend(file_path_in_pak_bytes)
+                
+                spans = reader.chunk_spans(entry)
+                raw_size = spans[-1][0] + spans[-1][1] - spans[0][0] if spans else 0
+                if run_size and (reader is not run_reader or run_offset + run_size != entry['file_offset']
+                                 or run_size >= COPY_RUN_SIZE):
+                    run_reader.copy_span(run_offset, run_size, pak_file, stats.cancel_token)
+                    run_size = 0
+                if not run_size:
+                    run_reader, run_offset = reader, entry['file_offset']
+                run_size += raw_size
+                offset_to_metadata += raw_size
+                stats.file_done(raw_size, raw_size)
+            
+            if run_size:
+                run_reader.copy_span(run_offset, run_size, pak_file, stats.cancel_token)
+            
+            stats.begin_phase('metadata')
+            stats.message("\nCompressing metadata...")
+            write_pak_metadata(pak_file, len(merged), meta_part_1, meta_part_2, offset_to_metadata)
+        os.replace(write_path, output_file)
+    except BaseException as e:
+        if write_path is not None and os.path.exists(write_path):
+            os.remove(write_path)
+        if not isinstance(e, OperationCancelled):
+            raise
+        stats.cancelled = True
+        stats.error("Merging cancelled")
+        return stats.finish(False)
+    finally:
+        for reader in readers:
+            reader.close()
+    
+    stats.message(f"\n✓ Successfully merged to: {output_file}\n")
+    return stats.finish(True)
+
 
 def main():
     print("=" * 60)
@@ -507,21 +2731,30 @@ def main():
     print(f"System: {'64-bit' if is_64bit else '32-bit'}")
     print(f"CPU Cores: {multiprocessing.cpu_count()}")
     
-    # Load DLLs
+    # Load an LZO backend
     if not load_dlls():
-        print("\nERROR: Failed to load LZO DLLs.")
-        print("Make sure the DLL files are in the same folder as this program.")
+        print("\nERROR: Failed to load an LZO backend.")
+        print("Make sure the DLL files are in the same folder as this program,")
+        print("or install liblzo2 / python-lzo.")
         return
     
-    print("DLLs loaded successfully\n")
+    print(f"LZO backend: {get_lzo_backend()}")
+    if not can_compress_lzo():
+        print("(pure-Python fallback - slow, and packing stores chunks uncompressed)")
+    print()
     
     # Check if file was dragged onto exe
     if len(sys.argv) < 2:
         print("Usage:")
         print("  - Drag and drop a .pak file to UNPACK it")
         print("  - Drag and drop a folder to PACK it into a .pak file")
+        print("  - pak_tool.py --verify file.pak [...] to check PAK files without unpacking")
         return
     
+    if sys.argv[1] == '--verify':
+        results = [verify_pak(pak_path, progress=print_progress) for pak_path in sys.argv[2:]]
+        sys.exit(0 if results and all(results) else 1)
+    
     input_path = sys.argv[1]
     
     if not os.path.exists(input_path):
@@ -546,7 +2779,7 @@ def main():
         
         os.makedirs(output_folder, exist_ok=True)
         
-        success = unpack_pak(input_path, output_folder, use_parallel=True)
+        success = unpack_pak(input_path, output_folder, use_parallel=True, progress=print_progress)
         
     elif os.path.isdir(input_path):
         # PACK mode
@@ -559,7 +2792,22 @@ def main():
                 print("Operation cancelled.")
                 return
         
-        success = pack_pak(input_path, output_pak, use_compression=True, use_parallel=False)
+        # Repacking over an earlier pack only recompresses changed files
+        previous_pak = output_pak if os.path.exists(output_pak) else None
+        
+        # Chunks compressed by earlier packs are kept next to the program
+        try:
+            chunk_cache = ChunkCache(os.path.join(_get_app_dir(), 'chunk_cache.db'))
+        except sqlite3.Error as e:
+            print(f"NOTE: Chunk cache unavailable, compressing everything: {e}\n")
+            chunk_cache = None
+        
+        try:
+            success = pack_pak(input_path, output_pak, use_compression=True, use_parallel=True,
+                               previous_pak=previous_pak, chunk_cache=chunk_cache, progress=print_progress)
+        finally:
+            if chunk_cache is not None:
+                chunk_cache.close()
 
 if __name__ == "__main__":
     try: